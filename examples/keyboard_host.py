@@ -22,28 +22,30 @@ from guh.util.clocks import CLOCK_FREQUENCIES_60MHZ
 # TODO: shrink or remove these lookup tables. We should be able to
 # reduce area usage quite a bit by dropping them.
 
+def _hid_to_ascii_table(letters, digits):
+    """Build a 256-entry HID keycode -> ASCII table as an immutable ``bytes``."""
+    table = bytearray(256)
+    table[0x04:0x04 + len(letters)] = letters.encode()
+    table[0x1E:0x1E + len(digits)] = digits.encode()
+    table[0x2C] = ord(' ')   # Space
+    table[0x28] = ord('\r')  # Enter
+    return bytes(table)
+
 # HID keycode to ASCII lookup (unshifted)
 # Keycodes 0x04-0x1D = a-z, 0x1E-0x27 = 1-0, 0x2C = space, 0x28 = enter
-HID_TO_ASCII = [0] * 256
-for i, c in enumerate("abcdefghijklmnopqrstuvwxyz"):
-    HID_TO_ASCII[0x04 + i] = ord(c)
-for i, c in enumerate("1234567890"):
-    HID_TO_ASCII[0x1E + i] = ord(c)
-HID_TO_ASCII[0x2C] = ord(' ')   # Space
-HID_TO_ASCII[0x28] = ord('\r')  # Enter
+HID_TO_ASCII = _hid_to_ascii_table("abcdefghijklmnopqrstuvwxyz", "1234567890")
 
 # Shifted versions (uppercase letters, symbols on number keys)
-HID_TO_ASCII_SHIFT = [0] * 256
-for i, c in enumerate("ABCDEFGHIJKLMNOPQRSTUVWXYZ"):
-    HID_TO_ASCII_SHIFT[0x04 + i] = ord(c)
-for i, c in enumerate("!@#$%^&*()"):
-    HID_TO_ASCII_SHIFT[0x1E + i] = ord(c)
-HID_TO_ASCII_SHIFT[0x2C] = ord(' ')
-HID_TO_ASCII_SHIFT[0x28] = ord('\r')
+HID_TO_ASCII_SHIFT = _hid_to_ascii_table("ABCDEFGHIJKLMNOPQRSTUVWXYZ", "!@#$%^&*()")
+
+# Both tables in a single ROM, addressed by {shift, keycode}
+HID_TO_ASCII_COMBINED = HID_TO_ASCII + HID_TO_ASCII_SHIFT
 
 
 class USBKeyboardHostExample(Elaboratable):
 
+    _FSM_ENCODING = "one-hot"
+
     def elaborate(self, platform):
         m = Module()
 
@@ -64,43 +66,47 @@ class USBKeyboardHostExample(Elaboratable):
         if hasattr(uart_pins.tx, 'oe'):
             m.d.comb += uart_pins.tx.oe.eq(1)  # Cynthion has tristate UART TX
 
-        # HID to ASCII lookup tables
-        m.submodules.ascii_mem = ascii_mem = Memory(shape=8, depth=256, init=HID_TO_ASCII)
-        m.submodules.ascii_shift_mem = ascii_shift_mem = Memory(shape=8, depth=256, init=HID_TO_ASCII_SHIFT)
+        # HID to ASCII lookup table (shift state selects the upper half)
+        m.submodules.ascii_mem = ascii_mem = Memory(shape=8, depth=512, init=HID_TO_ASCII_COMBINED)
         ascii_rd = ascii_mem.read_port(domain="usb")
-        ascii_shift_rd = ascii_shift_mem.read_port(domain="usb")
 
         # Track previous key to detect new presses
         prev_key0 = Signal(8)
         current_report = Signal(KeyboardReport)
         shift_held = Signal()
 
+        # Shift held if either left or right shift is pressed
+        def shift_pressed(report):
+            return report.modifiers.left_shift | report.modifiers.right_shift
+
         # Connect lookup address
+        ascii_char = Signal(8)
         m.d.comb += [
-            ascii_rd.addr.eq(current_report.key0),
-            ascii_shift_rd.addr.eq(current_report.key0),
-            # Shift held if either left or right shift is pressed
-            shift_held.eq(current_report.modifiers.left_shift | current_report.modifiers.right_shift),
+            shift_held.eq(shift_pressed(current_report)),
+            ascii_rd.addr.eq(Cat(current_report.key0, shift_held)),
+            ascii_char.eq(ascii_rd.data),
         ]
 
-        # Select ASCII based on shift state
-        ascii_char = Signal(8)
-        m.d.comb += ascii_char.eq(Mux(shift_held, ascii_shift_rd.data, ascii_rd.data))
+        # New key pressed? (evaluated directly on the incoming report)
+        incoming = kbd_host.o_report.payload
+        incoming_key = incoming.key0
+        is_new = Signal()
+        m.d.comb += is_new.eq((incoming_key ^ prev_key0).any() & incoming_key.any())
 
-        with m.FSM(domain="usb"):
+        with m.FSM(domain="usb") as fsm:
             with m.State("IDLE"):
-                m.d.comb += kbd_host.o_report.ready.eq(1)
+                # Look up the incoming key, so ascii_char is ready on entry to SEND
+                m.d.comb += [
+                    kbd_host.o_report.ready.eq(1),
+                    ascii_rd.addr.eq(Cat(incoming_key, shift_pressed(incoming))),
+                ]
                 with m.If(kbd_host.o_report.valid):
-                    m.d.usb += current_report.eq(kbd_host.o_report.payload)
-                    m.next = "CHECK"
-
-            with m.State("CHECK"):
-                with m.If((current_report.key0 != prev_key0) & (current_report.key0 != 0)):
-                    m.d.usb += prev_key0.eq(current_report.key0)
-                    m.next = "SEND"
-                with m.Else():
-                    m.d.usb += prev_key0.eq(current_report.key0)
-                    m.next = "IDLE"
+                    m.d.usb += [
+                        current_report.eq(kbd_host.o_report.payload),
+                        prev_key0.eq(incoming_key),
+                    ]
+                    with m.If(is_new):
+                        m.next = "SEND"
 
             with m.State("SEND"):
                 with m.If(ascii_char != 0):
@@ -113,11 +119,11 @@ class USBKeyboardHostExample(Elaboratable):
                 with m.Else():
                     m.next = "IDLE"
 
+        fsm.state.attrs["fsm_encoding"] = self._FSM_ENCODING
+
         # LED0=any key pressed, LED1=shift held
-        m.d.comb += [
-            platform.request("led", 0).o.eq(current_report.key0 != 0),
-            platform.request("led", 1).o.eq(shift_held),
-        ]
+        leds = Cat(platform.request("led", n).o for n in range(2))
+        m.d.comb += leds.eq(Cat(current_report.key0 != 0, shift_held))
 
         return m
 
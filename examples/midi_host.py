@@ -12,7 +12,9 @@ at 115200 baud, and displays a packet counter on onboard LEDs.
 """
 
 from amaranth import *
-from amaranth.lib import wiring
+from amaranth.lib import fifo, wiring
+
+from luna.gateware.stream.future import Packet
 
 from guh.engines.midi import USBMIDIHost
 from guh.util.clocks import CLOCK_FREQUENCIES_60MHZ
@@ -40,7 +42,12 @@ class USBMIDIHostExample(Elaboratable):
         if hasattr(uart_pins.tx, 'oe'):
             m.d.comb += uart_pins.tx.oe.eq(1)  # Cynthion has tristate UART TX
 
-        wiring.connect(m, midi_host.o_midi, hexdump.i)
+        # The UART drains far slower than USB delivers, so give the engine
+        # a deep FIFO to fill rather than stalling (and NAKing) upstream.
+        m.submodules.rx_fifo = rx_fifo = DomainRenamer("usb")(fifo.SyncFIFOBuffered(
+            width=Packet(unsigned(8)).size, depth=2048))
+        wiring.connect(m, midi_host.o_midi, rx_fifo.w_stream)
+        wiring.connect(m, rx_fifo.r_stream, hexdump.i)
 
         # Count complete USB-MIDI events (4 bytes each, marked by 'last')
         packet_count = Signal(32)
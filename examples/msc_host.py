@@ -31,7 +31,9 @@ class USBMSCHostExample(Elaboratable):
         m.d.comb += vbus_en.o.eq(1)
 
         ulpi = platform.request("target_phy")
-        m.submodules.msc_host = msc_host = USBMSCHost(bus=ulpi)
+        # The UART drains far slower than USB delivers, so give the engine
+        # a deep rx FIFO to fill rather than stalling (and NAKing) upstream.
+        m.submodules.msc_host = msc_host = USBMSCHost(bus=ulpi, rx_fifo_depth=2048)
 
         # UART Hex dump (115200 baud at 60MHz)
         uart_pins = platform.request("uart")
@@ -50,17 +52,22 @@ class USBMSCHostExample(Elaboratable):
         m.d.comb += led1.o.eq(msc_host.status.busy)
 
         # trigger block read once per second (60MHz USB clock)
-        timer = Signal(32)
+        # A 10-bit prescaler keeps the 1 second counter (and its compare) narrow.
+        ticks_per_second = 60_000_000 >> 10
+        presc = Signal(10)
+        ticks = Signal(range(ticks_per_second))
         read_pending = Signal()
 
-        # Count up to 1 second, then set read_pending
-        with m.If(timer >= 60_000_000 - 1):
-            m.d.usb += [
-                timer.eq(0),
-                read_pending.eq(1),
-            ]
-        with m.Else():
-            m.d.usb += timer.eq(timer + 1)
+        # Count up to (roughly) 1 second, then set read_pending
+        m.d.usb += presc.eq(presc + 1)
+        with m.If(presc == 2**len(presc) - 1):
+            with m.If(ticks == ticks_per_second - 1):
+                m.d.usb += [
+                    ticks.eq(0),
+                    read_pending.eq(1),
+                ]
+            with m.Else():
+                m.d.usb += ticks.eq(ticks + 1)
 
         with m.If(msc_host.status.ready & read_pending & ~msc_host.status.busy):
             m.d.comb += [
@@ -11,7 +11,7 @@ from amaranth.lib.cdc import ResetInserter
 from amaranth.lib.wiring import In, Out
 
 from guh.usbh.enumerator import USBHostEnumerator
-from guh.usbh.sie import TransferType, TransferResponse, DataPID
+from guh.usbh.poller import USBPoller
 from guh.usbh.descriptor import USBDescriptorParser, EndpointFilter
 from guh.protocol.descriptors import *
 
@@ -53,6 +53,8 @@ class USBKeyboardHost(wiring.Component):
     # At 60MHz, 3*60000000 cycles = ~3 seconds
     _WATCHDOG_CYCLES = 3 * 60000000
 
+    _FSM_ENCODING = "one-hot"
+
     # Output stream of keyboard reports
     o_report: Out(stream.Signature(KeyboardReport))
 
@@ -82,82 +84,63 @@ class USBKeyboardHost(wiring.Component):
 
         m.submodules.enumerator = enum = self.enumerator
 
-        # Watchdog: kicked on successful device responses, triggers reset on timeout
-        watchdog = Signal(32)
-        watchdog_expired = Signal()
-        m.d.usb += watchdog.eq(watchdog + 1)
-        m.d.comb += watchdog_expired.eq(watchdog == (self._WATCHDOG_CYCLES - 1))
-
-        pid = Signal(DataPID, init=DataPID.DATA0)
-        l_sof_frame = Signal(11)
-
+        # Poll the keyboard endpoint once per SOF (includes the watchdog)
+        m.submodules.poller = poller = USBPoller(watchdog_cycles=self._WATCHDOG_CYCLES)
+        m.d.comb += [
+            poller.enumerated.eq(enum.status.enumerated & enum.parser.o.valid),
+            poller.dev_addr.eq(enum.status.dev_addr),
+            poller.ep_addr.eq(enum.parser.o.i_endp.number),
+            poller.xfer_status.eq(enum.ctrl.status),
+            enum.ctrl.xfer.eq(poller.xfer),
+        ]
+
+        # Saturates at KEYBOARD_REPORT_SIZE (8), so 'report complete' is just
+        # its MSB rather than a pair of magnitude comparators.
+        assert KEYBOARD_REPORT_SIZE == 8
         rx_byte_count = Signal(4)
-        report_bytes = Array([Signal(8, name=f"report_byte{i}") for i in range(KEYBOARD_REPORT_SIZE)])
-        report = KeyboardReport(self.o_report.payload)
-
-        # RX path: collect bytes into report_bytes
+        done = Signal()
+        m.d.comb += done.eq(rx_byte_count[3])
+        # Bytes arrive strictly in order, so the report is collected in a
+        # shift register (new bytes enter at the top) rather than an Array.
+        # The same register drives o_report directly.
+        report_reg = Signal(KeyboardReport)
+        packed = report_reg.as_value()
+        # Payload is only qualified by o_report.valid, so it is driven outside
+        # the FSM: a bare register output with no per-state gating.
+        m.d.comb += self.o_report.payload.eq(report_reg)
+        # The reserved byte carries no information in the boot protocol.
+        m.d.comb += self.o_report.payload.reserved.eq(0)
+
+        # RX path: shift bytes into packed
         with m.If(enum.ctrl.rxs.valid & enum.ctrl.rxs.ready):
-            with m.If(rx_byte_count < KEYBOARD_REPORT_SIZE):
-                m.d.usb += report_bytes[rx_byte_count].eq(enum.ctrl.rxs.payload)
-            m.d.usb += rx_byte_count.eq(rx_byte_count + 1)
+            with m.If(~done):
+                m.d.usb += [
+                    packed.eq(Cat(packed[8:], enum.ctrl.rxs.payload)),
+                    rx_byte_count.eq(rx_byte_count + 1),
+                ]
 
-        with m.FSM(domain="usb"):
+        # Reset byte counter at start of each transfer
+        with m.If(poller.xfer.start):
+            m.d.usb += rx_byte_count.eq(0)
 
-            with m.State("WAIT-ENUMERATION"):
-                with m.If(enum.status.enumerated & enum.parser.o.valid):
-                    m.d.usb += watchdog.eq(0)  # Kick watchdog on successful enumeration
-                    m.next = "KBD-POLL"
+        with m.FSM(domain="usb") as fsm:
 
             with m.State("KBD-POLL"):
                 m.d.comb += enum.ctrl.rxs.ready.eq(1)
-
-                # Issue an IN transaction (poll) every SOF (1ms, not every microframe)
-                with m.If(enum.ctrl.status.idle & (enum.ctrl.status.sof_frame != l_sof_frame)):
-                    m.d.comb += [
-                        enum.ctrl.xfer.start.eq(1),
-                        enum.ctrl.xfer.type.eq(TransferType.IN),
-                        enum.ctrl.xfer.data_pid.eq(pid),
-                        enum.ctrl.xfer.dev_addr.eq(enum.status.dev_addr),
-                        enum.ctrl.xfer.ep_addr.eq(enum.parser.o.i_endp.number),
-                    ]
-                    # Reset byte counter at start of each transfer
-                    m.d.usb += [
-                        l_sof_frame.eq(enum.ctrl.status.sof_frame),
-                        rx_byte_count.eq(0),
-                    ]
-                with m.Else():
-                    with m.Switch(enum.ctrl.status.response):
-                        with m.Case(TransferResponse.ACK):
-                            # Success: toggle data PID, kick watchdog
-                            m.d.usb += [
-                                pid.eq(Mux(pid, DataPID.DATA0, DataPID.DATA1)),
-                                watchdog.eq(0),
-                            ]
-                            # If we received a full report, emit it
-                            with m.If(rx_byte_count >= KEYBOARD_REPORT_SIZE):
-                                m.next = "EMIT-REPORT"
-                        with m.Case(TransferResponse.NAK):
-                            # Device has no data but responded: kick watchdog
-                            m.d.usb += watchdog.eq(0)
-                        with m.Case(TransferResponse.STALL):
-                            # STALL: let watchdog handle recovery
-                            pass
+                # If we received a full report, emit it
+                with m.If(poller.ack & done):
+                    m.next = "EMIT-REPORT"
 
             with m.State("EMIT-REPORT"):
-                # Output the assembled report, wait for consumer to accept
+                # Output the assembled report, wait for consumer to accept.
                 m.d.comb += [
-                    report.modifiers.eq(report_bytes[0]),
-                    report.reserved.eq(report_bytes[1]),
-                    report.key0.eq(report_bytes[2]),
-                    report.key1.eq(report_bytes[3]),
-                    report.key2.eq(report_bytes[4]),
-                    report.key3.eq(report_bytes[5]),
-                    report.key4.eq(report_bytes[6]),
-                    report.key5.eq(report_bytes[7]),
+                    poller.pause.eq(1),
                     self.o_report.valid.eq(1),
                 ]
                 with m.If(self.o_report.ready):
                     m.next = "KBD-POLL"
 
+        fsm.state.attrs["fsm_encoding"] = self._FSM_ENCODING
+
         # Watchdog triggers reset of both this module and enumerator
-        return ResetInserter({"usb": watchdog_expired})(m)
+        return ResetInserter({"usb": poller.watchdog_expired})(m)
@@ -13,7 +13,7 @@ from amaranth.lib.wiring import In, Out
 from luna.gateware.stream.future import Packet
 
 from guh.usbh.enumerator import USBHostEnumerator
-from guh.usbh.sie import TransferType, TransferResponse, DataPID
+from guh.usbh.poller import USBPoller
 from guh.usbh.descriptor import USBDescriptorParser, EndpointFilter
 from guh.protocol.descriptors import *
 
@@ -32,11 +32,18 @@ class USBMIDIHost(wiring.Component):
     # At 60MHz, 3*60000000 cycles = ~3 seconds
     _WATCHDOG_CYCLES = 3 * 60000000
 
+    # Only poll when midi_fifo has room for a full-speed max-size bulk packet.
+    _POLL_HEADROOM_BYTES = 64
+
     # After enumeration, transmits MIDI data received from device
     # (4-byte packets) with first/last framing
     o_midi: Out(stream.Signature(Packet(unsigned(8))))
 
-    def __init__(self, *, bus=None, handle_clocking=True, device_address=0x12):
+    def __init__(self, *, bus=None, handle_clocking=True, device_address=0x12, fifo_depth=128):
+        # MIDI RX FIFO depth: the only elasticity between the USB link and
+        # a slow consumer (e.g. a UART hexdump), so deeper -> fewer drops.
+        assert fifo_depth >= self._POLL_HEADROOM_BYTES
+        self._fifo_depth = fifo_depth
         self.enumerator = USBHostEnumerator(
             bus=bus,
             handle_clocking=handle_clocking,
@@ -62,18 +69,26 @@ class USBMIDIHost(wiring.Component):
 
         m.submodules.enumerator = enum = self.enumerator
 
-        # Watchdog: kicked on successful device responses, triggers reset on timeout
-        watchdog = Signal(32)
-        m.d.usb += watchdog.eq(watchdog + 1)
+        # Poll the (bulk) MIDI endpoint back-to-back while there is room for
+        # another packet in the FIFO (includes the watchdog)
+        m.submodules.poller = poller = USBPoller(
+            watchdog_cycles=self._WATCHDOG_CYCLES, sof_paced=False)
+        m.d.comb += [
+            poller.enumerated.eq(enum.status.enumerated & enum.parser.o.valid),
+            poller.dev_addr.eq(enum.status.dev_addr),
+            poller.ep_addr.eq(enum.parser.o.i_endp.number),
+            poller.xfer_status.eq(enum.ctrl.status),
+            enum.ctrl.xfer.eq(poller.xfer),
+        ]
 
         # MIDI RX FIFO with Packet framing
         packet_layout = Packet(unsigned(8))
         m.submodules.midi_fifo = midi_fifo = DomainRenamer("usb")(fifo.SyncFIFOBuffered(
-            width=packet_layout.size, depth=64))
+            width=packet_layout.size, depth=self._fifo_depth))
         wiring.connect(m, midi_fifo.r_stream, wiring.flipped(self.o_midi))
+        m.d.comb += poller.pause.eq(
+            (midi_fifo.depth - midi_fifo.level) < self._POLL_HEADROOM_BYTES)
 
-        pid = Signal(DataPID, init=DataPID.DATA0)
-        l_sof_frame = Signal(11)
         rx_byte_count = Signal(2)
 
         # RX path: add first/last markers based on 4-byte USB-MIDI event boundaries
@@ -90,44 +105,9 @@ class USBMIDIHost(wiring.Component):
         with m.If(enum.ctrl.rxs.valid & enum.ctrl.rxs.ready):
             m.d.usb += rx_byte_count.eq(rx_byte_count + 1)
 
-        with m.FSM(domain="usb"):
-
-            with m.State("WAIT-ENUMERATION"):
-
-                with m.If(enum.status.enumerated & enum.parser.o.valid):
-                    m.d.usb += watchdog.eq(0)  # Kick watchdog on successful enumeration
-                    m.next = "MIDI-POLL"
-
-            with m.State("MIDI-POLL"):
-
-                # Issue an IN transaction (poll) every SOF (1ms, not every microframe)
-                with m.If(enum.ctrl.status.idle & (enum.ctrl.status.sof_frame != l_sof_frame)):
-                    m.d.comb += [
-                        enum.ctrl.xfer.start.eq(1),
-                        enum.ctrl.xfer.type.eq(TransferType.IN),
-                        enum.ctrl.xfer.data_pid.eq(pid),
-                        enum.ctrl.xfer.dev_addr.eq(enum.status.dev_addr),
-                        enum.ctrl.xfer.ep_addr.eq(enum.parser.o.i_endp.number),
-                    ]
-                    # Reset byte counter at start of each transfer
-                    m.d.usb += [
-                        l_sof_frame.eq(enum.ctrl.status.sof_frame),
-                        rx_byte_count.eq(0),
-                    ]
-                with m.Else():
-                    with m.Switch(enum.ctrl.status.response):
-                        with m.Case(TransferResponse.ACK):
-                            # Success: toggle data PID, kick watchdog
-                            m.d.usb += [
-                                pid.eq(Mux(pid, DataPID.DATA0, DataPID.DATA1)),
-                                watchdog.eq(0),
-                            ]
-                        with m.Case(TransferResponse.NAK):
-                            # Device has no data but responded: kick watchdog
-                            m.d.usb += watchdog.eq(0)
-                        with m.Case(TransferResponse.STALL):
-                            # STALL: let watchdog handle recovery
-                            pass
+        # Reset byte counter at start of each transfer
+        with m.If(poller.xfer.start):
+            m.d.usb += rx_byte_count.eq(0)
 
         # Watchdog triggers reset of both this module and enumerator
-        return ResetInserter({"usb": watchdog == (self._WATCHDOG_CYCLES - 1)})(m)
+        return ResetInserter({"usb": poller.watchdog_expired})(m)
@@ -39,6 +39,10 @@ class SCSIOpCode(enum.Enum, shape=unsigned(8)):
     READ_10          = 0x28
 
 
+# Opcodes whose CDB is 6 bytes long. Everything else is sent as a CDB10.
+CDB6_OPCODES = (SCSIOpCode.TEST_UNIT_READY, SCSIOpCode.REQUEST_SENSE)
+
+
 class CBWFlags(enum.Enum, shape=unsigned(8)):
     DATA_OUT = 0x00  # Host to device
     DATA_IN  = 0x80  # Device to host
@@ -96,11 +100,20 @@ CBW_SIZE_BYTES = CBW.as_shape().size // 8
 CSW_SIZE_BYTES = CSW.as_shape().size // 8
 READ_CAPACITY_SIZE_BYTES = ReadCapacity10Response.as_shape().size // 8
 
+# Fields of every CBW that are fixed at elaboration time (LUN 0, reserved
+# bits zero). The rest are overridden per command.
+CBW_TEMPLATE = CBW.const({
+    "dCBWSignature": CBW_SIGNATURE,
+    "bCBWLUN":       0,
+})
+
 
 def byteswap(value):
+    """Reverse byte order. Pure wiring: no logic is generated."""
     value = Value.cast(value)
     assert len(value) % 8 == 0
-    return Cat(value[i:i+8] for i in reversed(range(0, len(value), 8)))
+    octets = data.View(data.ArrayLayout(unsigned(8), len(value) // 8), value)
+    return Cat(octets[i] for i in reversed(range(len(octets))))
 
 # ============================================================
 # USB MSC / SCSI Command Wrapper Engine
@@ -111,17 +124,15 @@ class SCSIBulkHost(wiring.Component):
     """
     SCSI command wrapper transport engine (bulk-only BBB).
     Issues CBWs, parses CSWs (protocol which encapsulates the actual commands)
-    On read ops, data is streamed out rx_data.
+    Any data phase is streamed out rx_data; interpreting it (e.g. a READ
+    CAPACITY response) is left to higher layers.
 
-    TODO: drop non-streaming mode and punt this to higher layers.
     TODO: handle more error conditions.
     """
 
     class Command(data.Struct):
         start:       unsigned(1)
         data_len:    unsigned(32)
-        stream_data: unsigned(1) # 0=capture to self.captured, 1=stream to rx_data
-                                 # TODO: probably cleaner to drop self.captured...
         cdb:         data.UnionLayout({
             "cdb6":  CDB6,
             "cdb10": CDB10,
@@ -132,13 +143,23 @@ class SCSIBulkHost(wiring.Component):
         done:     unsigned(1)
         error:    unsigned(1)
         rejected: unsigned(1)
+        rx_room:  unsigned(1) # rx_data can absorb cmd.data_len without stalling
 
     cmd:      In(Command)
     status:   Out(Status)
     rx_data:  Out(stream.Signature(Packet(unsigned(8))))
-    captured: Out(ReadCapacity10Response)
 
-    def __init__(self, **kwargs):
+    # HS bulk packets are up to 512 bytes; the rx FIFO must always be able
+    # to absorb a whole packet (see DATA state).
+    _MAX_BULK_PACKET_BYTES = 512
+
+    _FSM_ENCODING = "one-hot"
+
+    def __init__(self, *, rx_fifo_depth=2 * _MAX_BULK_PACKET_BYTES, **kwargs):
+        # Every packet of headroom beyond the first lets another bulk-IN be
+        # issued while the consumer is still draining, instead of stalling.
+        assert rx_fifo_depth >= self._MAX_BULK_PACKET_BYTES
+        self._rx_fifo_depth = rx_fifo_depth
         self.enumerator = USBHostEnumerator(
             **kwargs,
             config_number=1,
@@ -158,26 +179,27 @@ class SCSIBulkHost(wiring.Component):
         m.submodules.enumerator = enum = self.enumerator
         packet_layout = Packet(unsigned(8))
 
-        # HS bulk packets are up to 512 bytes; the rx FIFO must always be able
-        # to absorb a whole packet (see DATA state).
-        MAX_BULK_PACKET_BYTES = 512
-        RX_FIFO_DEPTH = 600
-        assert RX_FIFO_DEPTH >= MAX_BULK_PACKET_BYTES
+        # SyncFIFOBuffered keeps one entry in its output register, so the +1
+        # leaves the backing memory exactly rx_fifo_depth deep: a whole number
+        # of block RAMs, with plain wrapping (comparator-free) pointers when
+        # rx_fifo_depth is a power of two.
         m.submodules.rx_fifo = rx_fifo = DomainRenamer("usb")(fifo.SyncFIFOBuffered(
-            width=packet_layout.size, depth=RX_FIFO_DEPTH))
+            width=packet_layout.size, depth=self._rx_fifo_depth + 1))
         wiring.connect(m, rx_fifo.r_stream, wiring.flipped(self.rx_data))
 
         cbw_tag = Signal(32, init=1)
         tx_byte_idx = Signal(range(CBW_SIZE_BYTES))
-        rx_byte_idx = Signal(10)
-        rx_data_count = Signal(16)
-        data_len = Signal(32)
+        # One-hot byte lane write-enable for the CSW. Shifted once per
+        # received byte, so each byte of csw_sig gets its own simple enable.
+        rx_lane = Signal(CSW_SIZE_BYTES, init=1)
+        # Data phase bytes still expected. Counts down, so 'last' and
+        # end-of-data are small constant compares rather than comparisons
+        # against the (full CBW width) transfer length.
+        bytes_remaining = Signal.like(self.cmd.data_len)
+        rx_first = Signal()
 
         csw_sig = Signal(CSW)
         csw_flat = csw_sig.as_value()
-        captured_sig = Signal(ReadCapacity10Response)
-        captured_flat = captured_sig.as_value()
-        m.d.comb += self.captured.eq(captured_sig)
 
         endp_in = enum.parser.o.i_endp.number
         endp_out = enum.parser.o.o_endp.number
@@ -185,18 +207,18 @@ class SCSIBulkHost(wiring.Component):
         pid_out = Signal(DataPID, init=DataPID.DATA0)
 
         rx_packet = packet_layout(rx_fifo.w_stream.payload)
-        stream_mode = Signal()
 
         # Build CBW from command
         cbw_sig = Signal(CBW)
         cdb_opcode = CDB6(self.cmd.cdb.cdb6).opcode
         cdb_len = Signal(5)
-        m.d.comb += cdb_len.eq(Mux(
-            (cdb_opcode == SCSIOpCode.TEST_UNIT_READY) | (cdb_opcode == SCSIOpCode.REQUEST_SENSE),
-            6, 10))
+        # One bit per opcode, set for 6-byte CDBs: a single bit lookup no
+        # matter how many opcodes are added, rather than a comparator each.
+        cdb6_opcode_mask = Const(sum(1 << op.value for op in CDB6_OPCODES), 256)
+        m.d.comb += cdb_len.eq(Mux(cdb6_opcode_mask.bit_select(cdb_opcode, 1), 6, 10))
 
         m.d.comb += [
-            cbw_sig.dCBWSignature.eq(CBW_SIGNATURE),
+            cbw_sig.eq(CBW_TEMPLATE),
             cbw_sig.dCBWTag.eq(cbw_tag),
             cbw_sig.dCBWDataTransferLength.eq(self.cmd.data_len),
             cbw_sig.bmCBWFlags.eq(Mux(self.cmd.data_len > 0, CBWFlags.DATA_IN, CBWFlags.DATA_OUT)),
@@ -204,9 +226,10 @@ class SCSIBulkHost(wiring.Component):
             cbw_sig.CBWCB.eq(self.cmd.cdb),
         ]
 
-        cbw_flat = cbw_sig.as_value()
-        cbw_byte_out = Signal(8)
-        m.d.comb += cbw_byte_out.eq((cbw_flat >> (tx_byte_idx * 8)) & 0xFF)
+        # Latched when the command is accepted and shifted down one byte per
+        # TX FIFO write, so the outgoing byte is always the low 8 bits rather
+        # than a CBW_SIZE_BYTES:1 byte select.
+        cbw_shift = Signal.like(cbw_sig.as_value())
 
         def start_bulk_out(endp):
             return [
@@ -226,9 +249,21 @@ class SCSIBulkHost(wiring.Component):
                 enum.ctrl.xfer.ep_addr.eq(endp),
             ]
 
+        # Only issue a data phase bulk-IN token once rx_fifo has room for
+        # a full packet: the receive path can't pause mid-packet, so less
+        # headroom would silently drop bytes under downstream backpressure.
+        rx_has_room = Signal()
+        m.d.comb += rx_has_room.eq(
+            (rx_fifo.depth - rx_fifo.level) >= self._MAX_BULK_PACKET_BYTES)
+
+        # A data phase that fits in rx_fifo never waits on the consumer. Larger
+        # ones can't fit at all, so those only wait for the FIFO to empty.
+        m.d.comb += self.status.rx_room.eq(
+            ((rx_fifo.depth - rx_fifo.level) >= self.cmd.data_len) | (rx_fifo.level == 0))
+
         m.d.comb += self.status.idle.eq(0)
 
-        with m.FSM(domain="usb"):
+        with m.FSM(domain="usb") as fsm:
 
             with m.State("WAIT-ENUMERATION"):
                 with m.If(enum.status.enumerated & enum.parser.o.valid):
@@ -239,18 +274,21 @@ class SCSIBulkHost(wiring.Component):
                 with m.If(self.cmd.start):
                     m.d.usb += [
                         tx_byte_idx.eq(0),
-                        data_len.eq(self.cmd.data_len),
-                        stream_mode.eq(self.cmd.stream_data),
+                        cbw_shift.eq(cbw_sig.as_value()),
+                        bytes_remaining.eq(self.cmd.data_len),
                     ]
                     m.next = "CBW-LOAD"
 
             with m.State("CBW-LOAD"):
                 m.d.comb += [
                     enum.ctrl.txs.valid.eq(1),
-                    enum.ctrl.txs.payload.eq(cbw_byte_out),
+                    enum.ctrl.txs.payload.eq(cbw_shift[:8]),
                 ]
                 with m.If(enum.ctrl.txs.ready):
-                    m.d.usb += tx_byte_idx.eq(tx_byte_idx + 1)
+                    m.d.usb += [
+                        tx_byte_idx.eq(tx_byte_idx + 1),
+                        cbw_shift.eq(cbw_shift >> 8),
+                    ]
                     with m.If(tx_byte_idx == CBW_SIZE_BYTES - 1):
                         m.d.usb += tx_byte_idx.eq(0)
                         m.next = "CBW-XFER"
@@ -265,14 +303,20 @@ class SCSIBulkHost(wiring.Component):
                     with m.Switch(enum.ctrl.status.response):
                         with m.Case(TransferResponse.ACK):
                             m.d.usb += [
-                                pid_out.eq(Mux(pid_out, DataPID.DATA0, DataPID.DATA1)),
-                                rx_byte_idx.eq(0),
-                                rx_data_count.eq(0),
+                                pid_out.eq(~pid_out.as_value()),
+                                rx_first.eq(1),
                             ]
-                            with m.If(data_len > 0):
-                                m.next = "DATA"
+                            # The SIE is idle, so the first bulk-IN of the
+                            # next phase can be issued in this same cycle.
+                            with m.If(bytes_remaining == 0):
+                                m.d.comb += start_bulk_in(endp_in)
+                                m.d.usb += rx_lane.eq(1)
+                                m.next = "CSW-RX"
+                            with m.Elif(rx_has_room):
+                                m.d.comb += start_bulk_in(endp_in)
+                                m.next = "DATA-RX"
                             with m.Else():
-                                m.next = "CSW"
+                                m.next = "DATA"
                         with m.Default():
                             m.d.comb += [
                                 self.status.done.eq(1),
@@ -281,68 +325,56 @@ class SCSIBulkHost(wiring.Component):
                             m.next = "IDLE"
 
             with m.State("DATA"):
-                # Only issue the next bulk-IN token once rx_fifo has room for
-                # a full packet: the receive path can't pause mid-packet, so
-                # less headroom would silently drop bytes under downstream
-                # backpressure. (Captured non-stream reads bypass the FIFO.)
-                rx_has_room = Signal()
-                m.d.comb += rx_has_room.eq(
-                    (rx_fifo.depth - rx_fifo.level) >= MAX_BULK_PACKET_BYTES)
-                with m.If(enum.ctrl.status.idle & (rx_has_room | ~stream_mode)):
+                with m.If(enum.ctrl.status.idle & rx_has_room):
                     m.d.comb += start_bulk_in(endp_in)
                     m.next = "DATA-RX"
 
             with m.State("DATA-RX"):
-                with m.If(stream_mode):
-                    m.d.comb += [
-                        enum.ctrl.rxs.ready.eq(rx_fifo.w_stream.ready),
-                        rx_fifo.w_stream.valid.eq(enum.ctrl.rxs.valid),
-                        rx_packet.data.eq(enum.ctrl.rxs.payload),
-                        rx_packet.first.eq(rx_data_count == 0),
-                        rx_packet.last.eq(rx_data_count == (data_len - 1)),
-                    ]
-                with m.Else():
-                    m.d.comb += enum.ctrl.rxs.ready.eq(1)
-                    with m.If(enum.ctrl.rxs.valid):
-                        m.d.usb += captured_flat.word_select(rx_byte_idx, 8).eq(enum.ctrl.rxs.payload)
+                m.d.comb += [
+                    enum.ctrl.rxs.ready.eq(rx_fifo.w_stream.ready),
+                    rx_fifo.w_stream.valid.eq(enum.ctrl.rxs.valid),
+                    rx_packet.data.eq(enum.ctrl.rxs.payload),
+                    rx_packet.first.eq(rx_first),
+                    rx_packet.last.eq(bytes_remaining == 1),
+                ]
 
                 with m.If(enum.ctrl.rxs.valid & enum.ctrl.rxs.ready):
-                    m.d.usb += [
-                        rx_byte_idx.eq(rx_byte_idx + 1),
-                        rx_data_count.eq(rx_data_count + 1),
-                    ]
+                    m.d.usb += rx_first.eq(0)
+                    with m.If(bytes_remaining != 0):
+                        m.d.usb += bytes_remaining.eq(bytes_remaining - 1)
 
                 with m.If(enum.ctrl.status.idle):
                     with m.Switch(enum.ctrl.status.response):
                         with m.Case(TransferResponse.ACK):
-                            m.d.usb += pid_in.eq(Mux(pid_in, DataPID.DATA0, DataPID.DATA1))
-                            with m.If(rx_data_count >= data_len):
-                                m.d.usb += rx_byte_idx.eq(0)
+                            m.d.usb += pid_in.eq(~pid_in.as_value())
+                            with m.If(bytes_remaining == 0):
                                 m.next = "CSW"
                             with m.Else():
                                 m.next = "DATA"
                         with m.Case(TransferResponse.NAK):
-                            m.next = "DATA"
+                            # Nothing was written, so rx_fifo still has room:
+                            # re-arm immediately rather than via DATA.
+                            m.d.comb += start_bulk_in(endp_in)
 
             with m.State("CSW"):
                 with m.If(enum.ctrl.status.idle):
                     m.d.comb += start_bulk_in(endp_in)
-                    m.d.usb += rx_byte_idx.eq(0)
+                    m.d.usb += rx_lane.eq(1)
                     m.next = "CSW-RX"
 
             with m.State("CSW-RX"):
                 m.d.comb += enum.ctrl.rxs.ready.eq(1)
                 with m.If(enum.ctrl.rxs.valid):
-                    m.d.usb += [
-                        csw_flat.word_select(rx_byte_idx, 8).eq(enum.ctrl.rxs.payload),
-                        rx_byte_idx.eq(rx_byte_idx + 1),
-                    ]
+                    for i in range(CSW_SIZE_BYTES):
+                        with m.If(rx_lane[i]):
+                            m.d.usb += csw_flat.word_select(i, 8).eq(enum.ctrl.rxs.payload)
+                    m.d.usb += rx_lane.eq(rx_lane << 1)
 
                 with m.If(enum.ctrl.status.idle):
                     with m.Switch(enum.ctrl.status.response):
                         with m.Case(TransferResponse.ACK):
                             m.d.usb += [
-                                pid_in.eq(Mux(pid_in, DataPID.DATA0, DataPID.DATA1)),
+                                pid_in.eq(~pid_in.as_value()),
                                 cbw_tag.eq(cbw_tag + 1),
                             ]
                             m.d.comb += [
@@ -351,7 +383,11 @@ class SCSIBulkHost(wiring.Component):
                             ]
                             m.next = "IDLE"
                         with m.Case(TransferResponse.NAK):
-                            m.next = "CSW"
+                            # Device not ready yet: re-arm without leaving CSW-RX.
+                            m.d.comb += start_bulk_in(endp_in)
+                            m.d.usb += rx_lane.eq(1)
+
+        fsm.state.attrs["fsm_encoding"] = self._FSM_ENCODING
 
         return m
 
@@ -362,7 +398,7 @@ class SCSIBulkHost(wiring.Component):
 
 # Max
 MAX_BLOCKS_PER_READ = 64
-assert MAX_BLOCKS_PER_READ <= 255  # must fit the low byte of xfer_len_be
+assert MAX_BLOCKS_PER_READ < 2**16  # must fit xfer_len_be
 
 
 class USBMSCHost(wiring.Component):
@@ -384,6 +420,10 @@ class USBMSCHost(wiring.Component):
     5. Check resp.done and resp.error. resp.error is not very helpful, but
        at least you know if something failed. For debugging resp.error
        your next step is usually a USB analyzer :)
+    6. The next read may be started as soon as status.ready returns, even
+       if rx_data is still draining the previous one: the rx FIFO decouples
+       the consumer from the bus. Bulk-only transport permits just one
+       outstanding CBW per device, so this is as much overlap as we get.
 
     Eventually, this engine could be used to feed a pure-gateware DMA engine.
 
@@ -413,17 +453,20 @@ class USBMSCHost(wiring.Component):
     _READ_RETRY_MAX = 5               # READ_10 retries before reporting failure
     _RETRY_DELAY_CYCLES = 2048        # ~34 µs at 60 MHz, post-CSW settling time
     _DEFAULT_BLOCK_SIZE_BYTES = 512   # vast majority of block devices use 512-byte blocks
+    _FSM_ENCODING = "one-hot"
 
     status:  Out(Status)
     cmd:     In(Command)
     resp:    Out(Response)
     rx_data: Out(stream.Signature(Packet(unsigned(8))))
 
-    def __init__(self, *, bus=None, handle_clocking=True, device_address=0x12):
+    def __init__(self, *, bus=None, handle_clocking=True, device_address=0x12,
+                 rx_fifo_depth=2 * SCSIBulkHost._MAX_BULK_PACKET_BYTES):
         self.scsi = SCSIBulkHost(
             bus=bus,
             handle_clocking=handle_clocking,
             device_address=device_address,
+            rx_fifo_depth=rx_fifo_depth,
         )
         super().__init__()
 
@@ -438,7 +481,21 @@ class USBMSCHost(wiring.Component):
         m.submodules.scsi = scsi = self.scsi
         enum = scsi.enumerator
 
-        wiring.connect(m, scsi.rx_data, wiring.flipped(self.rx_data))
+        # READ CAPACITY responses arrive on the same stream as block data.
+        # While one is outstanding, rx bytes are shifted into capacity_reg
+        # (in order, new bytes enter at the top) instead of being forwarded.
+        # The data phase precedes the CSW on the wire, so the FIFO has long
+        # drained by the time scsi.status.done is seen.
+        capture = Signal()
+        capacity_reg = Signal(ReadCapacity10Response)
+        capacity_flat = capacity_reg.as_value()
+        m.d.comb += [
+            self.rx_data.payload.eq(scsi.rx_data.payload),
+            self.rx_data.valid.eq(scsi.rx_data.valid & ~capture),
+            scsi.rx_data.ready.eq(self.rx_data.ready | capture),
+        ]
+        with m.If(capture & scsi.rx_data.valid):
+            m.d.usb += capacity_flat.eq(Cat(capacity_flat[8:], scsi.rx_data.payload.data))
 
         block_size = Signal(16, init=self._DEFAULT_BLOCK_SIZE_BYTES)
         block_count = Signal(32)
@@ -450,11 +507,16 @@ class USBMSCHost(wiring.Component):
 
         xfer_blocks = Signal(range(MAX_BLOCKS_PER_READ + 1))  # decoded: 1..MAX_BLOCKS_PER_READ
         m.d.comb += xfer_blocks.eq(current_block_count + 1)
+        xfer_len = Signal(16)  # zero-extended, for the big-endian CDB field
+        m.d.comb += xfer_len.eq(xfer_blocks)
 
-        watchdog = Signal(32)
+        # Counts down, so expiry is a zero test rather than a wide compare
+        # against _WATCHDOG_CYCLES. Reloaded on kick and by its own reset.
+        watchdog = Signal(range(self._WATCHDOG_CYCLES), init=self._WATCHDOG_CYCLES - 1)
         watchdog_expired = Signal()
-        m.d.usb += watchdog.eq(watchdog + 1)
-        m.d.comb += watchdog_expired.eq(watchdog >= (self._WATCHDOG_CYCLES - 1))
+        m.d.usb += watchdog.eq(watchdog - 1)
+        m.d.comb += watchdog_expired.eq(watchdog == 0)
+        kick_watchdog = watchdog.eq(self._WATCHDOG_CYCLES - 1)
 
         m.d.comb += [
             self.status.connected.eq(enum.status.enumerated),
@@ -473,28 +535,26 @@ class USBMSCHost(wiring.Component):
         read_capacity_setup = [
             cdb10.opcode.eq(SCSIOpCode.READ_CAPACITY_10),
             scsi_cmd.data_len.eq(READ_CAPACITY_SIZE_BYTES),
+            capture.eq(1),
         ]
         read10_setup = [
             cdb10.opcode.eq(SCSIOpCode.READ_10),
             cdb10.lba_be.eq(byteswap(current_lba)),
-            # xfer_blocks fits in low byte; high byte is always zero.
-            cdb10.xfer_len_be.eq(Cat(Const(0, 8), xfer_blocks)),
+            cdb10.xfer_len_be.eq(byteswap(xfer_len)),
             scsi_cmd.data_len.eq(block_size * xfer_blocks),
-            scsi_cmd.stream_data.eq(1),
         ]
 
-        with m.FSM(domain="usb"):
+        with m.FSM(domain="usb") as fsm:
 
             with m.State("WAIT-ENUMERATION"):
                 with m.If(scsi.status.idle):
-                    m.d.usb += [watchdog.eq(0), init_retry.eq(0)]
+                    m.d.usb += [kick_watchdog, init_retry.eq(0)]
                     m.next = "TEST-UNIT-READY"
 
             with m.State("TEST-UNIT-READY"):
                 m.d.comb += [
                     cdb6.opcode.eq(SCSIOpCode.TEST_UNIT_READY),
                     scsi_cmd.data_len.eq(0),
-                    scsi_cmd.stream_data.eq(0),
                     scsi_cmd.start.eq(1),
                 ]
                 m.next = "TEST-UNIT-READY-WAIT"
@@ -503,7 +563,7 @@ class USBMSCHost(wiring.Component):
                 m.d.comb += cdb6.opcode.eq(SCSIOpCode.TEST_UNIT_READY)
                 with m.If(scsi.status.done):
                     with m.If(~scsi.status.error & ~scsi.status.rejected):
-                        m.d.usb += [watchdog.eq(0), init_retry.eq(0)]
+                        m.d.usb += [kick_watchdog, init_retry.eq(0)]
                         m.next = "READ-CAPACITY"
                     with m.Else():
                         m.d.usb += init_retry.eq(init_retry + 1)
@@ -520,9 +580,9 @@ class USBMSCHost(wiring.Component):
                 m.d.comb += read_capacity_setup
                 with m.If(scsi.status.done):
                     with m.If(~scsi.status.error & ~scsi.status.rejected):
-                        m.d.usb += watchdog.eq(0)
-                        last_lba_le = byteswap(scsi.captured.last_lba_be)
-                        blk_size_le = byteswap(scsi.captured.block_size_be)
+                        m.d.usb += kick_watchdog
+                        last_lba_le = byteswap(capacity_reg.last_lba_be)
+                        blk_size_le = byteswap(capacity_reg.block_size_be)
                         m.d.usb += [
                             block_count.eq(last_lba_le + 1),
                             block_size.eq(blk_size_le[0:16]),
@@ -542,8 +602,12 @@ class USBMSCHost(wiring.Component):
                     m.next = "READ"
 
             with m.State("READ"):
-                m.d.comb += read10_setup + [scsi_cmd.start.eq(1)]
-                m.next = "READ-WAIT"
+                # Hold the command until rx_data can take the whole read, so
+                # its bulk-INs go out back-to-back.
+                m.d.comb += read10_setup
+                with m.If(scsi.status.rx_room):
+                    m.d.comb += scsi_cmd.start.eq(1)
+                    m.next = "READ-WAIT"
 
             with m.State("READ-WAIT"):
                 m.d.comb += read10_setup
@@ -559,7 +623,7 @@ class USBMSCHost(wiring.Component):
                     with m.Else():
                         # Success, or out of retry budget.
                         with m.If(~failed):
-                            m.d.usb += watchdog.eq(0)
+                            m.d.usb += kick_watchdog
                         m.d.usb += read_retry.eq(0)
                         m.d.comb += [
                             self.resp.done.eq(1),
@@ -572,4 +636,6 @@ class USBMSCHost(wiring.Component):
                 with m.If(retry_timer == 0):
                     m.next = "READ"
 
+        fsm.state.attrs["fsm_encoding"] = self._FSM_ENCODING
+
         return ResetInserter({"usb": watchdog_expired})(m)
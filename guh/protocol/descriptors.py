@@ -111,3 +111,34 @@ class EndpointAddress(data.Struct):
 class EndpointAttributes(data.Struct):
     transfer_type: EndpointTransferType  # Transfer type (bits 1:0)
     _reserved:     unsigned(6)           # Reserved (bits 7:2)
+
+
+class ConfigDescriptorHeader(data.Struct):
+    """Configuration descriptor fields following bLength."""
+    bDescriptorType:     DescriptorType
+    wTotalLength:        unsigned(16)
+    bNumInterfaces:      unsigned(8)
+    bConfigurationValue: unsigned(8)
+    iConfiguration:      unsigned(8)
+    bmAttributes:        unsigned(8)
+    bMaxPower:           unsigned(8)
+
+
+class InterfaceDescriptorHeader(data.Struct):
+    """Interface descriptor fields following bLength."""
+    bDescriptorType:    DescriptorType
+    bInterfaceNumber:   unsigned(8)
+    bAlternateSetting:  unsigned(8)
+    bNumEndpoints:      unsigned(8)
+    bInterfaceClass:    InterfaceClass
+    bInterfaceSubClass: unsigned(8)  # Meaning depends on bInterfaceClass
+    bInterfaceProtocol: unsigned(8)  # Meaning depends on bInterfaceClass
+
+
+class EndpointDescriptorHeader(data.Struct):
+    """Endpoint descriptor fields following bLength."""
+    bDescriptorType:  DescriptorType
+    bEndpointAddress: EndpointAddress
+    bmAttributes:     EndpointAttributes
+    wMaxPacketSize:   unsigned(16)
+    bInterval:        unsigned(8)
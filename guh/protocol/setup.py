@@ -59,7 +59,7 @@ class SetupPayload(data.Struct):
 
     def _dict_to_bytes(payload_dict):
         """Convert a SetupPayload init dict to a list of 8 bytes."""
-        v = Signal(SetupPayload, init=payload_dict).as_value().init
+        v = SetupPayload.const(payload_dict).as_value().value
         return [(v >> (n*8)) & 0xFF for n in range(8)]
 
     def get_descriptor(descriptor_type, descriptor_index=0, language_id=0, length=8):
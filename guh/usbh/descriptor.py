@@ -21,6 +21,33 @@ class EndpointFilter(Enum):
     IN_AND_OUT = auto()
 
 
+def _code_shape(code):
+    """
+    Shape to view an 8-bit interface subclass / protocol ``code`` filter as:
+    its enum if it is an enum member, else a plain byte.
+    """
+    if code is None:
+        return None
+    if isinstance(code, Enum):
+        shape = type(code)
+    elif isinstance(code, int) and 0 <= code < 256:
+        shape = unsigned(8)
+    else:
+        raise TypeError(f"Expected an 8-bit code or enum member, not {code!r}")
+    if Shape.cast(shape).width != 8:
+        raise TypeError(f"Expected an 8-bit code or enum member, not {code!r}")
+    return shape
+
+
+# Every descriptor the parser cares about, as seen from bDescriptorType on.
+# All members start with bDescriptorType.
+DescriptorHeader = data.UnionLayout({
+    "config":    ConfigDescriptorHeader,
+    "interface": InterfaceDescriptorHeader,
+    "endpoint":  EndpointDescriptorHeader,
+})
+
+
 class USBDescriptorParser(wiring.Component):
 
     """
@@ -35,169 +62,297 @@ class USBDescriptorParser(wiring.Component):
       before the configuration descriptor arrives.
     - After the descriptor is transferred, check ``o.valid`` and read endpoint(s) found.
 
-    TODO: this is kind of a big ugly streaming state machine, but it
-    seems quite reliable across all devices I have tested. Maybe it would be
-    cleaner to build some more Amaranth types to represent the different overall
-    descriptor structures, instead of this messy switch/case work...
+    Parsing stops at the configuration descriptor's wTotalLength, or at a
+    descriptor with a bLength too short to be valid.
+
+    Each descriptor's header is captured into a ``DescriptorHeader`` union,
+    and fields are read through its interface / endpoint views.
+
+    With ``debug=True``, each decoded descriptor is traced with ``Print``
+    (simulation only). Otherwise no ``Print`` statements are elaborated.
+
+    Constructing a ``USBDescriptorParser`` returns the subclass specialized
+    for ``endpoint_filter`` (``USBDescriptorParserIn``, ``USBDescriptorParserOut``
+    or ``USBDescriptorParserInOut``), so it must be given. The subclasses may
+    also be used directly, without it.
     """
 
-    def __init__(self, *, endpoint_filter, transfer_type, interface_class,
-                 interface_subclass=None, interface_protocol=None):
-        self._endpoint_filter = endpoint_filter
+    # Endpoint directions to extract, set by the specialized subclasses
+    _ENDPOINT_FILTER = None
+    _WANT_IN = False
+    _WANT_OUT = False
+
+    _FSM_ENCODING = "one-hot"
+
+    def __new__(cls, *, endpoint_filter=None, **kwargs):
+        if cls is USBDescriptorParser:
+            specialized = {
+                EndpointFilter.IN:         USBDescriptorParserIn,
+                EndpointFilter.OUT:        USBDescriptorParserOut,
+                EndpointFilter.IN_AND_OUT: USBDescriptorParserInOut,
+            }
+            if endpoint_filter not in specialized:
+                raise TypeError(f"Expected endpoint_filter to be one of "
+                                f"{', '.join(map(str, EndpointFilter))}, not {endpoint_filter!r}")
+            cls = specialized[endpoint_filter]
+        return super().__new__(cls)
+
+    def __init__(self, *, endpoint_filter=None, transfer_type, interface_class,
+                 interface_subclass=None, interface_protocol=None, debug=False):
+        if endpoint_filter not in (None, self._ENDPOINT_FILTER):
+            raise ValueError(f"{type(self).__name__} does not support {endpoint_filter}")
         self._transfer_type = transfer_type
         self._interface_class = interface_class
         self._interface_subclass = interface_subclass
         self._interface_protocol = interface_protocol
+        self._subclass_shape = _code_shape(interface_subclass)
+        self._protocol_shape = _code_shape(interface_protocol)
+        self._debug = debug
 
-        # Build output signature based on endpoint_filter
-        if endpoint_filter == EndpointFilter.IN:
-            o_layout = {"i_endp": EndpointAddress, "valid": unsigned(1)}
-        elif endpoint_filter == EndpointFilter.OUT:
-            o_layout = {"o_endp": EndpointAddress, "valid": unsigned(1)}
-        else:  # IN_AND_OUT
-            o_layout = {"i_endp": EndpointAddress, "o_endp": EndpointAddress, "valid": unsigned(1)}
-
-        self._o_signature = Out(data.StructLayout(o_layout))
         super().__init__({"enable": In(unsigned(1)),
                           "i": In(stream.Signature(unsigned(8))),
-                          "o": self._o_signature})
+                          "o": Out(self._O_LAYOUT)})
 
     def elaborate(self, platform):
 
         m = Module()
 
-        bLength = Signal(unsigned(8))
-        offset = Signal.like(bLength)
+        def trace(*args):
+            if self._debug:
+                m.d.usb += Print(*args)
 
-        desc_type = Signal(DescriptorType, init=0)
-        iface_class = Signal(InterfaceClass, init=0)
+        bLength = Signal(unsigned(8))
+        # Bytes left in the current descriptor after the one being received,
+        # so its last byte is a zero-detect. Loaded once per descriptor from
+        # bLength, minus bLength and bDescriptorType themselves.
+        remaining = Signal.like(bLength)
+
+        # The bytes after bLength, each captured by its own one-hot position
+        # bit. All fields we care about live in this header; the bytes of a
+        # descriptor past it are skipped.
+        header = Signal(DescriptorHeader)
+        header_bytes = data.View(data.ArrayLayout(unsigned(8), DescriptorHeader.size // 8),
+                                 header.as_value())
+        header_pos = Signal(len(header_bytes))
+
+        desc_type = header.interface.bDescriptorType
+        iface_class = header.interface.bInterfaceClass
+        # Subclass / protocol codes are class-specific, view them as such
+        if self._interface_subclass is not None:
+            iface_subclass = Signal(self._subclass_shape)
+            m.d.comb += iface_subclass.eq(header.interface.bInterfaceSubClass)
+        if self._interface_protocol is not None:
+            iface_protocol = Signal(self._protocol_shape)
+            m.d.comb += iface_protocol.eq(header.interface.bInterfaceProtocol)
+        endp_addr = header.endpoint.bEndpointAddress
+        endp_attr = header.endpoint.bmAttributes
+
+        # Field compares are made as each byte arrives and registered, so that
+        # stage B only has to AND flags together. Fields not being filtered on
+        # always match.
+        def header_pos_of(layout, field):
+            return layout.as_shape()[field].offset // 8
+        def header_range_of(layout, field):
+            pos = header_pos_of(layout, field)
+            return range(pos, pos + layout.as_shape()[field].width // 8)
+        # Header bytes read as-is. Everything else is matched by the field
+        # compares, and is only captured in full for the debug traces.
+        if self._debug:
+            captured_pos = range(len(header_bytes))
+        else:
+            captured_pos = {*header_range_of(ConfigDescriptorHeader, "wTotalLength"),
+                            *header_range_of(EndpointDescriptorHeader, "bEndpointAddress")}
+        iface_class_ok    = Signal()
+        iface_subclass_ok = Signal(init=1)
+        iface_protocol_ok = Signal(init=1)
+        endp_type_ok      = Signal()
+        field_compares = [
+            (iface_class_ok, InterfaceDescriptorHeader, "bInterfaceClass",
+             lambda byte: byte == self._interface_class),
+            (endp_type_ok, EndpointDescriptorHeader, "bmAttributes",
+             lambda byte: EndpointAttributes(byte).transfer_type == self._transfer_type),
+        ]
         if self._interface_subclass is not None:
-            iface_subclass = Signal(type(self._interface_subclass), init=0)
+            field_compares.append((iface_subclass_ok, InterfaceDescriptorHeader, "bInterfaceSubClass",
+                                   lambda byte: byte == self._interface_subclass))
         if self._interface_protocol is not None:
-            iface_protocol = Signal(type(self._interface_protocol), init=0)
+            field_compares.append((iface_protocol_ok, InterfaceDescriptorHeader, "bInterfaceProtocol",
+                                   lambda byte: byte == self._interface_protocol))
         in_matching_interface = Signal()
 
-        # Endpoint descriptor fields (temporary during parsing)
-        endp_addr = Signal(EndpointAddress)
-        endp_attr = Signal(EndpointAttributes)
-
         # Tracking which endpoints have been found
-        want_in = self._endpoint_filter in (EndpointFilter.IN, EndpointFilter.IN_AND_OUT)
-        want_out = self._endpoint_filter in (EndpointFilter.OUT, EndpointFilter.IN_AND_OUT)
-        found_in = Signal() if want_in else None
-        found_out = Signal() if want_out else None
+        want_in = self._WANT_IN
+        want_out = self._WANT_OUT
+        # Endpoints are captured into a slot per direction (indexed by
+        # EndpointDirection). Unwanted directions start out 'found', so they
+        # are never captured and don't hold up o.valid.
+        endp_slots = Array(Signal(EndpointAddress) for _ in EndpointDirection)
+        endp_found = Signal(len(EndpointDirection),
+                            init=(int(not want_out) << EndpointDirection.OUT.value) |
+                                 (int(not want_in)  << EndpointDirection.IN.value))
+        if want_in:
+            m.d.comb += self.o.i_endp.eq(endp_slots[EndpointDirection.IN.value])
+        if want_out:
+            m.d.comb += self.o.o_endp.eq(endp_slots[EndpointDirection.OUT.value])
 
         m.d.comb += self.i.ready.eq(1)
 
-        with m.FSM(domain="usb"):
+        # The parser is split into two pipeline stages, so that ingesting
+        # bytes and evaluating a finished descriptor never share a cycle:
+        #  - Stage A (the FSM) captures the header of each descriptor as its
+        #    bytes arrive, and pulses `commit` after the last one.
+        #  - Stage B runs on `commit`, one cycle later, and decodes the
+        #    captured fields (interface match, endpoint capture).
+        # Stage A may already be consuming the next descriptor's bLength
+        # while stage B runs; the header is only overwritten from the byte
+        # after that, so stage B always sees a stable descriptor.
+        commit = Signal()
+        m.d.usb += commit.eq(0)
+
+        # Bytes consumed so far, bounded by wTotalLength (counted from the
+        # start of the configuration descriptor) once that is decoded.
+        consumed = Signal(16)
+        desc_start = Signal.like(consumed)
+        total_length = Signal.like(consumed, init=2**16 - 1)
+        with m.If(self.i.valid & self.i.ready):
+            m.d.usb += consumed.eq(consumed + 1)
+
+        # bDescriptorType is decoded once, as it arrives. The decode picks
+        # which descriptors are skipped, and is registered for stage B.
+        byte_is_config    = Signal()
+        byte_is_interface = Signal()
+        byte_is_endpoint  = Signal()
+        m.d.comb += [
+            byte_is_config.eq(self.i.payload == DescriptorType.CONFIG),
+            byte_is_interface.eq(self.i.payload == DescriptorType.INTERFACE),
+            byte_is_endpoint.eq(self.i.payload == DescriptorType.ENDPOINT),
+        ]
+        # Only these descriptor types are captured past bDescriptorType
+        parsed_type = byte_is_config | byte_is_interface | byte_is_endpoint
+        is_config    = Signal()
+        is_interface = Signal()
+        is_endpoint  = Signal()
+
+        with m.FSM(domain="usb") as fsm:
             with m.State("INIT"):
                 m.d.comb += self.i.ready.eq(0)
                 with m.If(self.enable):
                     m.next = "GET-LEN"
             with m.State("GET-LEN"):
-                with m.If(self.i.valid):
-                    m.d.usb += offset.eq(0)
-                    m.d.usb += bLength.eq(self.i.payload)
+                with m.If(self.o.valid | (consumed >= total_length)):
+                    m.next = "DONE"
+                with m.Elif(self.i.valid & (self.i.payload < 2)):
+                    # Malformed (bLength counts itself and bDescriptorType)
+                    m.next = "DONE"
+                with m.Elif(self.i.valid):
+                    m.d.usb += [
+                        bLength.eq(self.i.payload),
+                        remaining.eq(self.i.payload - 2),
+                        header_pos.eq(1),
+                        desc_start.eq(consumed),
+                    ]
                     m.next = "IN-DESCRIPTOR"
             with m.State("IN-DESCRIPTOR"):
                 with m.If(self.i.valid):
-                    with m.Switch(offset):
-                        # Byte 1: descriptor type
-                        with m.Case(0):
-                            m.d.usb += desc_type.eq(self.i.payload)
-                        # Endpoint descriptor: byte 2 = bEndpointAddress
-                        with m.Case(1):
-                            with m.If(desc_type == DescriptorType.ENDPOINT):
-                                m.d.usb += endp_addr.eq(self.i.payload)
-                        # Endpoint descriptor: byte 3 = bmAttributes
-                        with m.Case(2):
-                            with m.If(desc_type == DescriptorType.ENDPOINT):
-                                m.d.usb += endp_attr.eq(self.i.payload)
-                        # Interface descriptor: byte 5 = bInterfaceClass
-                        with m.Case(4):
-                            with m.If(desc_type == DescriptorType.INTERFACE):
-                                m.d.usb += iface_class.eq(self.i.payload)
-                        # Interface descriptor: byte 6 = bInterfaceSubClass
-                        if self._interface_subclass is not None:
-                            with m.Case(5):
-                                with m.If(desc_type == DescriptorType.INTERFACE):
-                                    m.d.usb += iface_subclass.eq(self.i.payload)
-                        # Interface descriptor: byte 7 = bInterfaceProtocol
-                        if self._interface_protocol is not None:
-                            with m.Case(6):
-                                with m.If(desc_type == DescriptorType.INTERFACE):
-                                    m.d.usb += iface_protocol.eq(self.i.payload)
-
-                    m.d.usb += offset.eq(offset+1)
-
-                    # At the end of each descriptor
-                    with m.If(offset == (bLength-2)):
-                        m.d.usb += Print(desc_type, 'len =', bLength)
-                        # Interface descriptor: update in_matching_interface flag
-                        with m.If(desc_type == DescriptorType.INTERFACE):
-                            m.d.usb += Print('\t bInterfaceClass =', iface_class)
-                            if self._interface_subclass is not None:
-                                m.d.usb += Print('\t bInterfaceSubClass =', iface_subclass)
-                            if self._interface_protocol is not None:
-                                m.d.usb += Print('\t bInterfaceProtocol =', iface_protocol)
-
-                            # Check class match (and subclass/protocol if specified)
-                            interface_match = (iface_class == self._interface_class)
-                            if self._interface_subclass is not None:
-                                interface_match = interface_match & (iface_subclass == self._interface_subclass)
-                            if self._interface_protocol is not None:
-                                interface_match = interface_match & (iface_protocol == self._interface_protocol)
-
-                            with m.If(interface_match):
-                                m.d.usb += in_matching_interface.eq(1)
-                            with m.Else():
-                                m.d.usb += in_matching_interface.eq(0)
-
-                        # Endpoint descriptor: capture first matching endpoints
-                        capturing_in = Signal()
-                        capturing_out = Signal()
-
-                        with m.Elif((desc_type == DescriptorType.ENDPOINT)):
-                            m.d.usb += Print('\t bEndpointAddress = ', endp_addr)
-                            m.d.usb += Print('\t bmAttributes = ', endp_attr)
-                            with m.If(in_matching_interface):
-                                type_match = endp_attr.transfer_type == self._transfer_type
-                                is_in = endp_addr.direction == EndpointDirection.IN
-
-                                # Capture IN endpoint if wanted and not yet found
-                                if want_in:
-                                    with m.If(type_match & is_in & ~found_in):
-                                        m.d.comb += capturing_in.eq(1)
-                                        m.d.usb += [
-                                            self.o.i_endp.eq(endp_addr),
-                                            found_in.eq(1),
-                                            Print('\t **** EXTRACTED IN ****')
-                                        ]
-
-                                # Capture OUT endpoint if wanted and not yet found
-                                if want_out:
-                                    with m.If(type_match & ~is_in & ~found_out):
-                                        m.d.comb += capturing_out.eq(1)
-                                        m.d.usb += [
-                                            self.o.o_endp.eq(endp_addr),
-                                            found_out.eq(1),
-                                            Print('\t **** EXTRACTED OUT ****')
-                                        ]
-
-                        # Check if we have all required endpoints
-                        all_found = Const(1)
-                        if want_in:
-                            all_found = all_found & (found_in | capturing_in)
-                        if want_out:
-                            all_found = all_found & (found_out | capturing_out)
-
-                        with m.If(all_found):
-                            m.d.usb += self.o.valid.eq(1)
-                            m.next = "DONE"
-                        with m.Else():
-                            m.next = "GET-LEN"
+                    for n in sorted(captured_pos):
+                        with m.If(header_pos[n]):
+                            m.d.usb += header_bytes[n].eq(self.i.payload)
+                    for flag, layout, field, matches in field_compares:
+                        with m.If(header_pos[header_pos_of(layout, field)]):
+                            m.d.usb += flag.eq(matches(self.i.payload))
+                    with m.If(header_pos[0]):
+                        m.d.usb += [
+                            is_config.eq(byte_is_config),
+                            is_interface.eq(byte_is_interface),
+                            is_endpoint.eq(byte_is_endpoint),
+                        ]
+                    m.d.usb += [
+                        header_pos.eq(header_pos << 1),
+                        remaining.eq(remaining - 1),
+                    ]
+
+                    # At the end of each descriptor, hand over to stage B
+                    with m.If(remaining == 0):
+                        m.d.usb += commit.eq(1)
+                        m.next = "GET-LEN"
+                    # Descriptors we don't decode (class-specific, string ..)
+                    # are skipped once their bDescriptorType is known
+                    with m.Elif(header_pos[0] & ~parsed_type):
+                        m.next = "SKIP"
+            with m.State("SKIP"):
+                with m.If(self.i.valid):
+                    m.d.usb += remaining.eq(remaining - 1)
+                    with m.If(remaining == 0):
+                        m.d.usb += commit.eq(1)
+                        m.next = "GET-LEN"
 
             with m.State("DONE"):
                 pass
 
+        # Stage B: decode the descriptor captured by stage A
+        with m.If(commit & ~self.o.valid):
+            trace(desc_type, 'len =', bLength)
+            with m.If(is_config):
+                m.d.usb += total_length.eq(desc_start + header.config.wTotalLength)
+            # Interface descriptor: update in_matching_interface flag
+            with m.If(is_interface):
+                trace('\t bInterfaceClass =', iface_class)
+                if self._interface_subclass is not None:
+                    trace('\t bInterfaceSubClass =', iface_subclass)
+                if self._interface_protocol is not None:
+                    trace('\t bInterfaceProtocol =', iface_protocol)
+
+                # Check class match (and subclass/protocol if specified)
+                interface_match = iface_class_ok & iface_subclass_ok & iface_protocol_ok
+
+                with m.If(interface_match):
+                    m.d.usb += in_matching_interface.eq(1)
+                with m.Else():
+                    m.d.usb += in_matching_interface.eq(0)
+
+            # Endpoint descriptor: capture first matching endpoints
+            with m.Elif(is_endpoint):
+                trace('\t bEndpointAddress = ', endp_addr)
+                trace('\t bmAttributes = ', endp_attr)
+                with m.If(in_matching_interface):
+                    # Capture the first matching endpoint of each direction
+                    slot = endp_addr.direction.as_value()
+                    with m.If(endp_type_ok & ~endp_found.bit_select(slot, 1)):
+                        m.d.usb += [
+                            endp_slots[slot].eq(endp_addr),
+                            endp_found.bit_select(slot, 1).eq(1),
+                        ]
+                        trace('\t **** EXTRACTED', endp_addr.direction, '****')
+
+        # Done once all required endpoints are found. This is checked on the
+        # registered found mask, a cycle after the last capture, to keep it
+        # out of the stage B compare logic.
+        with m.If(endp_found.all()):
+            m.d.usb += self.o.valid.eq(1)
+
+        fsm.state.attrs["fsm_encoding"] = self._FSM_ENCODING
+
         return m
+
+
+class USBDescriptorParserIn(USBDescriptorParser):
+    """``USBDescriptorParser`` extracting a single IN endpoint."""
+    _ENDPOINT_FILTER = EndpointFilter.IN
+    _WANT_IN = True
+    _O_LAYOUT = data.StructLayout({"i_endp": EndpointAddress, "valid": unsigned(1)})
+
+
+class USBDescriptorParserOut(USBDescriptorParser):
+    """``USBDescriptorParser`` extracting a single OUT endpoint."""
+    _ENDPOINT_FILTER = EndpointFilter.OUT
+    _WANT_OUT = True
+    _O_LAYOUT = data.StructLayout({"o_endp": EndpointAddress, "valid": unsigned(1)})
+
+
+class USBDescriptorParserInOut(USBDescriptorParser):
+    """``USBDescriptorParser`` extracting both an IN and an OUT endpoint."""
+    _ENDPOINT_FILTER = EndpointFilter.IN_AND_OUT
+    _WANT_IN = True
+    _WANT_OUT = True
+    _O_LAYOUT = data.StructLayout({"i_endp": EndpointAddress, "o_endp": EndpointAddress,
+                                   "valid": unsigned(1)})
@@ -8,7 +8,6 @@ USB Host Enumerator - performs USB FS/HS enumeration sequence.
 from amaranth import *
 from amaranth.lib import data, stream, wiring
 from amaranth.lib.wiring import In, Out
-from amaranth.lib.memory import Memory
 
 from usb_protocol.types import DescriptorTypes
 
@@ -50,9 +49,14 @@ class USBHostEnumerator(wiring.Component):
     7. Assert 'enumerated', forward 'self.ctrl' for class-specific requests.
     """
 
-    # SOFs to wait until first enumeration packets are sent.
-    # TODO: enforce pow2 for this
-    _SOF_DELAY_RDY = 0x3f
+    # SOFs to wait until first enumeration packets are sent, as a power
+    # of 2 so that the end of the wait is a single counter bit.
+    _SOF_DELAY_LOG2 = 6
+
+    # State encoding for the (large) enumeration FSM, passed to synthesis as
+    # the 'fsm_encoding' attribute. One-hot keeps next-state decode shallow;
+    # override with e.g. "binary" or "auto" to compare.
+    _FSM_ENCODING = "one-hot"
 
     # Status outputs to driver
     status: Out(USBHostEnumeratorStatus)
@@ -84,32 +88,45 @@ class USBHostEnumerator(wiring.Component):
         # Instantiate SIE
         m.submodules.sie = sie = self.sie
 
-        # Setup Packet ROM
-        m.submodules.setup_packets = setup_packets = Memory(
-            shape=unsigned(8),
-            depth=40,
-            init=(
-                SetupPayload.get_descriptor(int(DescriptorTypes.DEVICE), 0, 0, 8) +
-                SetupPayload.get_descriptor(int(DescriptorTypes.DEVICE), 0, 0, 18) +
-                SetupPayload.set_address(self._device_address) +
-                SetupPayload.get_descriptor(int(DescriptorTypes.CONFIGURATION), 0, 0, 512) +
-                SetupPayload.set_configuration(self._config_number)
-            )
-        )
-        setup_mem = setup_packets.read_port(domain='comb')
+        # Setup Packet ROM, shared by all enumeration stages. One word per
+        # 8-byte packet, so the address is constant while a packet is loaded
+        # and bytes are selected from the word in transmit order.
+        # All packets (including the device address and configuration) are
+        # known at elaboration, so the ROM is built from constants rather
+        # than a Memory, letting synthesis fold the many constant bits.
+        setup_packet_init = [
+            SetupPayload.get_descriptor(int(DescriptorTypes.DEVICE), 0, 0, 8),
+            SetupPayload.get_descriptor(int(DescriptorTypes.DEVICE), 0, 0, 18),
+            SetupPayload.set_address(self._device_address),
+            SetupPayload.get_descriptor(int(DescriptorTypes.CONFIGURATION), 0, 0, 512),
+            SetupPayload.set_configuration(self._config_number),
+        ]
+        (SETUP_GET_DESC_DEVICE, SETUP_GET_DESC_DEVICE_FULL, SETUP_SET_ADDRESS,
+         SETUP_GET_DESC_CONFIG, SETUP_SET_CONFIG) = range(len(setup_packet_init))
+        setup_packets = Array(Const(int.from_bytes(bytes(packet), "little"), 64)
+                              for packet in setup_packet_init)
 
         # Bits of state discovered by state machine
         current_dev_addr = Signal(7, init=0)
         enum_retry       = Signal(range(4))
+        enum_retry_last  = Signal()  # Shared by all SETUP retry sites
         reset_triggered  = Signal(1, init=0)
-        setup_byte_ix    = Signal(range(8))
-        max_packet_size  = Signal(unsigned(8), init=64)
-        last_packet_byte = Signal(unsigned(8), init=0)
+        setup_packet     = Signal(range(len(setup_packet_init)))
+        setup_byte_oh    = Signal(9, init=1)  # One-hot byte of the setup packet, then token
+        # bMaxPacketSize0 may only be 8, 16, 32 or 64: kept as 8 << mps_log2
+        mps_log2         = Signal(2, init=3)
+        max_packet_size  = Const(8, 8) << mps_log2
+        mps0_byte        = Signal(unsigned(8), init=0)  # bMaxPacketSize0 as received
+        rx_byte_ix       = Signal(range(8))  # Byte index within an IN data packet
         enumerated       = Signal(1, init=0)
+        sof_prev         = Signal(1, init=0)
+        sof_delay_ctr    = Signal(self._SOF_DELAY_LOG2 + 1)
 
         # Speed discovered by reset sequencer (HS/FS)
         detected_speed = sie.ctrl.status.detected_speed
 
+        m.d.comb += enum_retry_last.eq(enum_retry.all())
+
         # Status outputs
         m.d.comb += [
             self.status.enumerated.eq(enumerated),
@@ -119,108 +136,106 @@ class USBHostEnumerator(wiring.Component):
         ]
 
         # Descriptor parser: wire to rxs during GET_CONFIGURATION IN phase
+        # desc_stream_active is decoded from the FSM state. It is registered,
+        # so the Rx -> parser valid only gates on a flip-flop (data arrives
+        # well after the IN phase is entered, and no data follows it).
         desc_stream_active = Signal()
+        desc_stream_en = Signal()
+        m.d.usb += desc_stream_en.eq(desc_stream_active)
         m.submodules.parser = parser = self.parser
         m.d.comb += [
             parser.enable.eq(1),
-            parser.i.valid.eq(desc_stream_active & sie.ctrl.rxs.valid),
+            parser.i.valid.eq(desc_stream_en & sie.ctrl.rxs.valid),
             parser.i.payload.eq(sie.ctrl.rxs.payload),
         ]
 
-        # ctrl pass-through: after enumeration, forward signals between driver and USBSIE
-        # During enumeration, enumerator owns the interface
-        with m.If(enumerated):
-            m.d.comb += [
-                sie.ctrl.xfer.eq(self.ctrl.xfer),
-                sie.ctrl.bus_reset.eq(self.ctrl.bus_reset),
-            ]
-            m.d.comb += self.ctrl.status.eq(sie.ctrl.status)
-            wiring.connect(m, wiring.flipped(self.ctrl.txs), sie.ctrl.txs)
-            wiring.connect(m, sie.ctrl.rxs, wiring.flipped(self.ctrl.rxs))
-
         # ============================================================
         # ENUMERATION HELPER FUNCTIONS
         # ============================================================
 
-        def make_load_setup_state(state_name, next_state, setup_offset):
-            """Generate state that loads 8 bytes from setup ROM to Tx FIFO."""
+        def make_setup_state(state_name, next_states, dev_addr):
+            """
+            Generate the SETUP stage state shared by all enumeration stages:
+            loads 8 bytes from setup ROM to Tx FIFO, then sends the SETUP token.
+            ``setup_packet`` selects the packet, and ``next_states`` maps each
+            packet to the state that waits for its ACK.
+            """
             with m.State(state_name):
-                m.d.comb += [
-                    setup_mem.addr.eq(setup_offset + setup_byte_ix),
-                    sie.ctrl.txs.payload.eq(setup_mem.data),
-                    sie.ctrl.txs.valid.eq(1),
-                ]
-                with m.If(sie.ctrl.txs.ready):
-                    m.d.usb += setup_byte_ix.eq(setup_byte_ix + 1)
-                    with m.If(setup_byte_ix == 7):
-                        m.d.usb += setup_byte_ix.eq(0)
-                        m.next = next_state
-
-        def make_setup_xfer_state(state_name, next_state, dev_addr):
-            """Generate state that sends SETUP token."""
-            with m.State(state_name):
-                with m.If(sie.ctrl.status.idle):
-                    m.d.comb += [
-                        sie.ctrl.xfer.start.eq(1),
-                        sie.ctrl.xfer.type.eq(TransferType.SETUP),
-                        sie.ctrl.xfer.data_pid.eq(DataPID.DATA0),
-                        sie.ctrl.xfer.dev_addr.eq(dev_addr),
-                        sie.ctrl.xfer.ep_addr.eq(0),
-                    ]
-                    m.next = next_state
-
-        def make_wait_ack_state(state_name, on_ack, on_error, retry_sig=None, retry_from=None):
-            """Generate state waiting for SETUP ACK with optional retry logic."""
+                with m.If(setup_byte_oh[8]):
+                    # All 8 bytes are in the Tx FIFO. The token can't go out on
+                    # the cycle of the last byte, as the SIE latches the FIFO
+                    # level as the transfer length on start.
+                    with m.If(sie.ctrl.status.idle):
+                        m.d.comb += [
+                            sie.ctrl.xfer.start.eq(1),
+                            sie.ctrl.xfer.type.eq(TransferType.SETUP),
+                            sie.ctrl.xfer.data_pid.eq(DataPID.DATA0),
+                            sie.ctrl.xfer.dev_addr.eq(dev_addr),
+                            sie.ctrl.xfer.ep_addr.eq(0),
+                        ]
+                        m.d.usb += setup_byte_oh.eq(1)
+                        with m.Switch(setup_packet):
+                            for packet, next_state in next_states.items():
+                                with m.Case(packet):
+                                    m.next = next_state
+                with m.Else():
+                    m.d.comb += sie.ctrl.txs.valid.eq(1)
+                    for n in range(8):
+                        with m.If(setup_byte_oh[n]):
+                            m.d.comb += sie.ctrl.txs.payload.eq(
+                                setup_packets[setup_packet].word_select(n, 8))
+                    with m.If(sie.ctrl.txs.ready):
+                        m.d.usb += setup_byte_oh.eq(setup_byte_oh << 1)
+
+        def make_wait_ack_state(state_name, on_ack, on_error, retry_from=None):
+            """
+            Generate state waiting for SETUP ACK. With ``retry_from``, failures
+            are retried from there (counted in ``enum_retry``) before giving up.
+            """
             with m.State(state_name):
                 with m.If(sie.ctrl.status.idle):
                     with m.Switch(sie.ctrl.status.response):
                         with m.Case(TransferResponse.ACK):
-                            if retry_sig is not None:
-                                m.d.usb += retry_sig.eq(0)
+                            if retry_from is not None:
+                                m.d.usb += enum_retry.eq(0)
                             m.next = on_ack
                         with m.Case(TransferResponse.NAK, TransferResponse.TIMEOUT):
-                            if retry_sig is not None:
-                                m.d.usb += retry_sig.eq(retry_sig + 1)
-                                with m.If(retry_sig >= 3):
-                                    m.d.usb += retry_sig.eq(0)
+                            if retry_from is not None:
+                                # Give up on the last retry. The increment
+                                # then wraps enum_retry back to 0.
+                                m.d.usb += enum_retry.eq(enum_retry + 1)
+                                with m.If(enum_retry_last):
                                     m.next = on_error
                                 with m.Else():
                                     m.next = retry_from
                             else:
                                 m.next = on_error
 
-        def make_in_data_states(load_state, wait_state, next_state, dev_addr):
-            """Generate IN data phase (2 states: send IN token, wait for data)."""
-            with m.State(load_state):
-                with m.If(sie.ctrl.status.idle):
-                    m.d.comb += [
-                        sie.ctrl.xfer.start.eq(1),
-                        sie.ctrl.xfer.type.eq(TransferType.IN),
-                        sie.ctrl.xfer.data_pid.eq(DataPID.DATA1),
-                        sie.ctrl.xfer.dev_addr.eq(dev_addr),
-                        sie.ctrl.xfer.ep_addr.eq(0),
-                    ]
-                    m.next = wait_state
+        def make_in_data_states(in_state, wait_state, next_states, dev_addr):
+            """
+            Generate the IN data phase (2 states: send IN token, wait for data),
+            shared by all stages that have one. ``setup_packet`` selects the stage:
+            the 8-byte device descriptor is a single packet (from which
+            bMaxPacketSize0 is captured), the others loop
+            until a short packet, and the configuration descriptor is streamed
+            to the parser. ``next_states`` maps each stage to its status phase.
+            """
+            multi_packet = Signal()
+            config_stage = Signal()
+            m.d.comb += [
+                multi_packet.eq(setup_packet != SETUP_GET_DESC_DEVICE),
+                config_stage.eq(setup_packet == SETUP_GET_DESC_CONFIG),
+            ]
 
-            with m.State(wait_state):
-                m.d.comb += sie.ctrl.rxs.ready.eq(1)
-                with m.If(sie.ctrl.rxs.valid):
-                    m.d.usb += last_packet_byte.eq(sie.ctrl.rxs.payload)
-                with m.If(sie.ctrl.status.idle):
-                    with m.Switch(sie.ctrl.status.response):
-                        with m.Case(TransferResponse.ACK):
-                            m.next = next_state
-                        with m.Case(TransferResponse.NAK):
-                            m.next = load_state
-                        with m.Default():
+            def goto_next_state():
+                with m.Switch(setup_packet):
+                    for packet, next_state in next_states.items():
+                        with m.Case(packet):
                             m.next = next_state
 
-        def make_multi_packet_in_states(in_state, wait_state, next_state, dev_addr,
-                                        emit_desc_stream=False):
-            """Generate multi-packet IN data phase (loops until short packet)."""
             with m.State(in_state):
-                if emit_desc_stream:
-                    m.d.comb += desc_stream_active.eq(1)
+                m.d.comb += desc_stream_active.eq(config_stage)
+                m.d.usb += rx_byte_ix.eq(0)
                 with m.If(sie.ctrl.status.idle):
                     m.d.comb += [
                         sie.ctrl.xfer.start.eq(1),
@@ -232,24 +247,34 @@ class USBHostEnumerator(wiring.Component):
                     m.next = wait_state
 
             with m.State(wait_state):
-                if emit_desc_stream:
-                    m.d.comb += desc_stream_active.eq(1)
-                m.d.comb += sie.ctrl.rxs.ready.eq(1)
+                m.d.comb += [
+                    desc_stream_active.eq(config_stage),
+                    sie.ctrl.rxs.ready.eq(1),
+                ]
+                with m.If(sie.ctrl.rxs.valid):
+                    m.d.usb += rx_byte_ix.eq(rx_byte_ix + 1)
+                    # bMaxPacketSize0 is byte 7 of the (8-byte) device descriptor
+                    with m.If(~multi_packet & (rx_byte_ix == 7)):
+                        m.d.usb += mps0_byte.eq(sie.ctrl.rxs.payload)
                 with m.If(sie.ctrl.status.idle):
                     with m.Switch(sie.ctrl.status.response):
                         with m.Case(TransferResponse.ACK):
-                            with m.If(sie.ctrl.status.rx_len == max_packet_size):
+                            with m.If(multi_packet & (sie.ctrl.status.rx_len == max_packet_size)):
                                 m.next = in_state
                             with m.Else():
-                                m.next = next_state
+                                goto_next_state()
                         with m.Case(TransferResponse.NAK):
                             m.next = in_state
                         with m.Default():
-                            m.next = next_state
+                            goto_next_state()
 
         def make_status_phase_states(status_state, wait_state, next_state, dev_addr,
-                                     direction_in, on_timeout):
-            """Generate status phase (2 states: send ZLP, wait for completion)."""
+                                     direction_in, on_timeout, on_ack_stmts=()):
+            """
+            Generate status phase (2 states: send ZLP, wait for completion).
+            ``on_ack_stmts`` are applied on the transition to ``next_state``,
+            so bookkeeping at the end of a stage doesn't need its own state.
+            """
             with m.State(status_state):
                 with m.If(sie.ctrl.status.idle):
                     m.d.comb += [
@@ -265,6 +290,7 @@ class USBHostEnumerator(wiring.Component):
                 with m.If(sie.ctrl.status.idle):
                     with m.Switch(sie.ctrl.status.response):
                         with m.Case(TransferResponse.ACK):
+                            m.d.usb += on_ack_stmts
                             m.next = next_state
                         with m.Case(TransferResponse.NAK):
                             m.next = status_state
@@ -276,7 +302,7 @@ class USBHostEnumerator(wiring.Component):
         # ============================================================
         # FSM - USB HOST ENUMERATION
         # ============================================================
-        with m.FSM(domain="usb"):
+        with m.FSM(domain="usb") as fsm:
 
             with m.State("INIT-RESET"):
                 with m.If(~reset_triggered):
@@ -287,151 +313,124 @@ class USBHostEnumerator(wiring.Component):
                     m.d.usb += [
                         enum_retry.eq(0),
                         reset_triggered.eq(0),
+                        sof_delay_ctr.eq(0),
+                        # Devices are back at address 0 after a bus reset
+                        current_dev_addr.eq(0),
                     ]
                     m.next = "WAIT-SIE-READY"
 
             with m.State("WAIT-SIE-READY"):
-                with m.If(sie.ctrl.status.idle &
-                         ((sie.ctrl.status.sof_frame & self._SOF_DELAY_RDY) == self._SOF_DELAY_RDY)):
-                    m.next = "ENUM-GET-DESC-DEVICE-LOAD"
+                # Count SOFs locally (the frame number LSB toggles once per
+                # frame), rather than decoding the SIE's frame number.
+                m.d.usb += sof_prev.eq(sie.ctrl.status.sof_frame[0])
+                with m.If(sie.ctrl.status.sof_frame[0] != sof_prev):
+                    m.d.usb += sof_delay_ctr.eq(sof_delay_ctr + 1)
+                with m.If(sie.ctrl.status.idle & sof_delay_ctr[-1]):
+                    m.d.usb += setup_packet.eq(SETUP_GET_DESC_DEVICE)
+                    m.next = "ENUM-SETUP"
+
+            # Each stage starts by sending its setup packet, selected by
+            # setup_packet, then continues with its own states. The device
+            # is at address 0 (current_dev_addr) until SET_ADDRESS completes.
+            make_setup_state("ENUM-SETUP", {
+                SETUP_GET_DESC_DEVICE:      "ENUM-GET-DESC-DEVICE-WAIT-SETUP",
+                SETUP_SET_ADDRESS:          "ENUM-SET-ADDRESS-WAIT-SETUP",
+                SETUP_GET_DESC_DEVICE_FULL: "ENUM-GET-DESC-DEVICE-FULL-WAIT-SETUP",
+                SETUP_GET_DESC_CONFIG:      "ENUM-GET-DESC-CONFIG-WAIT-SETUP",
+                SETUP_SET_CONFIG:           "ENUM-SET-CONFIG-WAIT-SETUP",
+            }, dev_addr=current_dev_addr)
+
+            # Likewise for the IN data phase of the GET_DESCRIPTOR stages.
+            # The configuration descriptor is the key stage: it is streamed
+            # to the descriptor parser during its IN phase.
+            make_in_data_states("ENUM-IN", "ENUM-WAIT-IN", {
+                SETUP_GET_DESC_DEVICE:      "ENUM-GET-DESC-DEVICE-STATUS",
+                SETUP_GET_DESC_DEVICE_FULL: "ENUM-GET-DESC-DEVICE-FULL-STATUS",
+                SETUP_GET_DESC_CONFIG:      "ENUM-GET-DESC-CONFIG-STATUS",
+            }, dev_addr=current_dev_addr)
 
             # -----------------------------------------------------------------
             # ENUMERATION STAGE 1: GET DEVICE DESCRIPTOR (8 bytes)
             # -----------------------------------------------------------------
 
-            make_load_setup_state("ENUM-GET-DESC-DEVICE-LOAD",
-                                  "ENUM-GET-DESC-DEVICE-XFER",
-                                  setup_offset=0)
-
-            make_setup_xfer_state("ENUM-GET-DESC-DEVICE-XFER",
-                                  "ENUM-GET-DESC-DEVICE-WAIT-SETUP",
-                                  dev_addr=0)
-
             make_wait_ack_state("ENUM-GET-DESC-DEVICE-WAIT-SETUP",
-                                on_ack="ENUM-GET-DESC-DEVICE-IN",
+                                on_ack="ENUM-IN",
                                 on_error="INIT-RESET",
-                                retry_sig=enum_retry,
-                                retry_from="ENUM-GET-DESC-DEVICE-LOAD")
-
-            make_in_data_states("ENUM-GET-DESC-DEVICE-IN",
-                                "ENUM-GET-DESC-DEVICE-WAIT-IN",
-                                "ENUM-GET-DESC-DEVICE-STATUS",
-                                dev_addr=0)
+                                retry_from="ENUM-SETUP")
 
             make_status_phase_states("ENUM-GET-DESC-DEVICE-STATUS",
                                      "ENUM-GET-DESC-DEVICE-WAIT-STATUS",
-                                     "ENUM-GET-DESC-DEVICE-SET-MPS",
+                                     "ENUM-SETUP",
                                      dev_addr=0,
                                      direction_in=0,
-                                     on_timeout="INIT-RESET")
-
-            with m.State("ENUM-GET-DESC-DEVICE-SET-MPS"):
-                m.d.usb += max_packet_size.eq(last_packet_byte)
-                m.next = "ENUM-GET-DESC-DEVICE-COMPLETE"
-
-            with m.State("ENUM-GET-DESC-DEVICE-COMPLETE"):
-                m.d.usb += enum_retry.eq(0)
-                m.next = "ENUM-SET-ADDRESS-LOAD"
+                                     on_timeout="INIT-RESET",
+                                     on_ack_stmts=[
+                                         mps_log2.eq(Mux(mps0_byte[6], 3,
+                                                     Mux(mps0_byte[5], 2,
+                                                     Mux(mps0_byte[4], 1, 0)))),
+                                         enum_retry.eq(0),
+                                         setup_packet.eq(SETUP_SET_ADDRESS),
+                                     ])
 
             # -----------------------------------------------------------------
             # ENUMERATION STAGE 2: SET ADDRESS
             # -----------------------------------------------------------------
 
-            make_load_setup_state("ENUM-SET-ADDRESS-LOAD",
-                                  "ENUM-SET-ADDRESS-XFER",
-                                  setup_offset=16)
-
-            make_setup_xfer_state("ENUM-SET-ADDRESS-XFER",
-                                  "ENUM-SET-ADDRESS-WAIT-SETUP",
-                                  dev_addr=0)
-
             make_wait_ack_state("ENUM-SET-ADDRESS-WAIT-SETUP",
                                 on_ack="ENUM-SET-ADDRESS-STATUS",
                                 on_error="INIT-RESET")
 
             make_status_phase_states("ENUM-SET-ADDRESS-STATUS",
                                      "ENUM-SET-ADDRESS-WAIT-STATUS",
-                                     "ENUM-SET-ADDRESS-UPDATE-ADDR",
+                                     "ENUM-SETUP",
                                      dev_addr=0,
                                      direction_in=1,
-                                     on_timeout="INIT-RESET")
-
-            with m.State("ENUM-SET-ADDRESS-UPDATE-ADDR"):
-                m.d.usb += [
-                    current_dev_addr.eq(self._device_address),
-                    enum_retry.eq(0)
-                ]
-                m.next = "ENUM-GET-DESC-DEVICE-FULL-LOAD"
+                                     on_timeout="INIT-RESET",
+                                     on_ack_stmts=[
+                                         current_dev_addr.eq(self._device_address),
+                                         enum_retry.eq(0),
+                                         setup_packet.eq(SETUP_GET_DESC_DEVICE_FULL),
+                                     ])
 
             # -----------------------------------------------------------------
             # ENUMERATION STAGE 3: GET FULL DEVICE DESCRIPTOR (18 bytes)
             # -----------------------------------------------------------------
 
-            make_load_setup_state("ENUM-GET-DESC-DEVICE-FULL-LOAD",
-                                  "ENUM-GET-DESC-DEVICE-FULL-XFER",
-                                  setup_offset=8)
-
-            make_setup_xfer_state("ENUM-GET-DESC-DEVICE-FULL-XFER",
-                                  "ENUM-GET-DESC-DEVICE-FULL-WAIT-SETUP",
-                                  dev_addr=current_dev_addr)
-
             make_wait_ack_state("ENUM-GET-DESC-DEVICE-FULL-WAIT-SETUP",
-                                on_ack="ENUM-GET-DESC-DEVICE-FULL-IN",
+                                on_ack="ENUM-IN",
                                 on_error="INIT-RESET",
-                                retry_sig=enum_retry,
-                                retry_from="ENUM-GET-DESC-DEVICE-FULL-LOAD")
-
-            make_multi_packet_in_states("ENUM-GET-DESC-DEVICE-FULL-IN",
-                                        "ENUM-GET-DESC-DEVICE-FULL-WAIT-IN",
-                                        "ENUM-GET-DESC-DEVICE-FULL-STATUS",
-                                        dev_addr=current_dev_addr)
+                                retry_from="ENUM-SETUP")
 
             make_status_phase_states("ENUM-GET-DESC-DEVICE-FULL-STATUS",
                                      "ENUM-GET-DESC-DEVICE-FULL-WAIT-STATUS",
-                                     "ENUM-GET-DESC-DEVICE-FULL-COMPLETE",
+                                     "ENUM-SETUP",
                                      dev_addr=current_dev_addr,
                                      direction_in=0,
-                                     on_timeout="INIT-RESET")
-
-            with m.State("ENUM-GET-DESC-DEVICE-FULL-COMPLETE"):
-                m.d.usb += enum_retry.eq(0)
-                m.next = "ENUM-GET-DESC-CONFIG-LOAD"
+                                     on_timeout="INIT-RESET",
+                                     on_ack_stmts=[
+                                         enum_retry.eq(0),
+                                         setup_packet.eq(SETUP_GET_DESC_CONFIG),
+                                     ])
 
             # -----------------------------------------------------------------
             # ENUMERATION STAGE 4: GET CONFIGURATION DESCRIPTOR
             # -----------------------------------------------------------------
 
-            make_load_setup_state("ENUM-GET-DESC-CONFIG-LOAD",
-                                  "ENUM-GET-DESC-CONFIG-XFER",
-                                  setup_offset=24)
-
-            make_setup_xfer_state("ENUM-GET-DESC-CONFIG-XFER",
-                                  "ENUM-GET-DESC-CONFIG-WAIT-SETUP",
-                                  dev_addr=current_dev_addr)
-
             make_wait_ack_state("ENUM-GET-DESC-CONFIG-WAIT-SETUP",
-                                on_ack="ENUM-GET-DESC-CONFIG-IN",
+                                on_ack="ENUM-IN",
                                 on_error="INIT-RESET",
-                                retry_sig=enum_retry,
-                                retry_from="ENUM-GET-DESC-CONFIG-LOAD")
-
-            # This is the key stage: emit desc_stream during IN phase
-            make_multi_packet_in_states("ENUM-GET-DESC-CONFIG-IN",
-                                        "ENUM-GET-DESC-CONFIG-WAIT-IN",
-                                        "ENUM-GET-DESC-CONFIG-STATUS",
-                                        dev_addr=current_dev_addr,
-                                        emit_desc_stream=True)
+                                retry_from="ENUM-SETUP")
 
             make_status_phase_states("ENUM-GET-DESC-CONFIG-STATUS",
                                      "ENUM-GET-DESC-CONFIG-WAIT-STATUS",
-                                     "ENUM-GET-DESC-CONFIG-COMPLETE",
+                                     "ENUM-SETUP",
                                      dev_addr=current_dev_addr,
                                      direction_in=0,
-                                     on_timeout="INIT-RESET")
-
-            with m.State("ENUM-GET-DESC-CONFIG-COMPLETE"):
-                m.d.usb += enum_retry.eq(0)
-                m.next = "ENUM-SET-CONFIG-LOAD"
+                                     on_timeout="INIT-RESET",
+                                     on_ack_stmts=[
+                                         enum_retry.eq(0),
+                                         setup_packet.eq(SETUP_SET_CONFIG),
+                                     ])
 
             # -----------------------------------------------------------------
             # ENUMERATION STAGE 5: SET CONFIGURATION (configuration 1)
@@ -444,35 +443,50 @@ class USBHostEnumerator(wiring.Component):
             # So far though, configuration 1 is correct for every single one
             # of the devices I have tested.
 
-            make_load_setup_state("ENUM-SET-CONFIG-LOAD",
-                                  "ENUM-SET-CONFIG-XFER",
-                                  setup_offset=32)
-
-            make_setup_xfer_state("ENUM-SET-CONFIG-XFER",
-                                  "ENUM-SET-CONFIG-WAIT-SETUP",
-                                  dev_addr=current_dev_addr)
-
             make_wait_ack_state("ENUM-SET-CONFIG-WAIT-SETUP",
                                 on_ack="ENUM-SET-CONFIG-STATUS",
                                 on_error="INIT-RESET")
 
             make_status_phase_states("ENUM-SET-CONFIG-STATUS",
                                      "ENUM-SET-CONFIG-WAIT-STATUS",
-                                     "ENUMERATION-COMPLETE",
+                                     "IDLE",
                                      dev_addr=current_dev_addr,
                                      direction_in=1,
-                                     on_timeout="INIT-RESET")
+                                     on_timeout="INIT-RESET",
+                                     on_ack_stmts=enumerated.eq(1))
 
             # -----------------------------------------------------------------
             # ENUMERATION COMPLETE - hand off to higher-level engine
             # -----------------------------------------------------------------
 
-            with m.State("ENUMERATION-COMPLETE"):
-                m.d.usb += enumerated.eq(1)
-                m.next = "IDLE"
-
             with m.State("IDLE"):
-                # Enumeration complete, driver has control of SIE via ctrl pass-through
+                # Enumeration complete, driver has control of SIE via ctrl pass-through.
+                # IDLE drives nothing, so the FSM is static from here on. It is
+                # deliberately not held in reset: its logic is needed again
+                # when the engine's watchdog resets us to re-enumerate, and
+                # reset would park it in INIT-RESET, which drives bus_reset.
                 pass
 
+        # ctrl pass-through: after enumeration, forward signals between driver and USBSIE
+        # During enumeration, enumerator owns the interface. Placed after the
+        # FSM so that it takes priority: the driver <-> SIE path is a single
+        # 2:1 mux on 'enumerated', rather than sitting behind every
+        # enumeration state that drives the same signals.
+        # Status and rx data towards the driver are plain wires; only the
+        # handshakes (which drivers may act on unconditionally) are gated.
+        m.d.comb += [
+            self.ctrl.status.eq(sie.ctrl.status),
+            self.ctrl.rxs.payload.eq(sie.ctrl.rxs.payload),
+        ]
+        with m.If(enumerated):
+            m.d.comb += [
+                sie.ctrl.xfer.eq(self.ctrl.xfer),
+                sie.ctrl.bus_reset.eq(self.ctrl.bus_reset),
+                self.ctrl.rxs.valid.eq(sie.ctrl.rxs.valid),
+                sie.ctrl.rxs.ready.eq(self.ctrl.rxs.ready),
+            ]
+            wiring.connect(m, wiring.flipped(self.ctrl.txs), sie.ctrl.txs)
+
+        fsm.state.attrs["fsm_encoding"] = self._FSM_ENCODING
+
         return m
@@ -0,0 +1,124 @@
+# Copyright (c) 2024 S. Holzapfel <me@sebholzapfel.com>
+#
+# SPDX-License-Identifier: BSD-3-Clause
+"""
+Periodic IN endpoint poller, shared by the simple host engines.
+"""
+
+from amaranth import *
+from amaranth.lib import wiring
+from amaranth.lib.wiring import In, Out
+
+from .sie import USBSIEInterface, TransferType, TransferResponse, DataPID
+
+
+class USBPoller(wiring.Component):
+
+    """
+    Once enumeration is complete, repeatedly issue IN transactions on a
+    single endpoint, tracking the data PID.
+
+    With ``sof_paced=True`` (suitable for interrupt endpoints), at most one
+    poll is issued every SOF (1ms, not every microframe). Otherwise, the next
+    poll is issued as soon as the previous one completes (suitable for bulk
+    endpoints), and it is up to the engine to hold ``pause`` while it has
+    no room for more data.
+
+    Includes the watchdog used by the host engines: it is kicked on every
+    response from the device, and ``watchdog_expired`` is asserted if nothing
+    is heard for ``watchdog_cycles``. Engines typically wrap themselves (and
+    the enumerator) in a ResetInserter driven by ``watchdog_expired``.
+
+    Usage:
+    - Drive ``enumerated``, ``dev_addr`` and ``ep_addr`` from the enumerator / parser.
+    - Forward ``xfer`` to the enumerator ``ctrl.xfer`` and ``ctrl.status`` to ``xfer_status``.
+    - ``xfer.start`` marks the start of each poll, ``ack`` strobes once for every
+      poll the device ACKs (i.e. after all of its data has arrived on ``ctrl.rxs``).
+    - Hold ``pause`` to stop issuing new polls (e.g. while the consumer is busy).
+    """
+
+    # The watchdog counts in units of 2**_WATCHDOG_PRESCALE_BITS cycles,
+    # which keeps the counter (and its comparator) narrow.
+    _WATCHDOG_PRESCALE_BITS = 8
+
+    _FSM_ENCODING = "one-hot"
+
+    enumerated:       In(1)
+    dev_addr:         In(7)
+    ep_addr:          In(4)
+    pause:            In(1)
+
+    xfer:             Out(USBSIEInterface.Transfer)
+    xfer_status:      In(USBSIEInterface.Status)
+
+    ack:              Out(1)
+    watchdog_expired: Out(1)
+
+    def __init__(self, *, watchdog_cycles, sof_paced=True):
+        self._watchdog_cycles = watchdog_cycles
+        self._sof_paced = sof_paced
+        super().__init__()
+
+    def elaborate(self, platform):
+        m = Module()
+
+        # Watchdog: kicked on successful device responses, triggers reset on timeout
+        watchdog_ticks = self._watchdog_cycles >> self._WATCHDOG_PRESCALE_BITS
+        watchdog_presc = Signal(self._WATCHDOG_PRESCALE_BITS)
+        watchdog = Signal(range(watchdog_ticks))
+        m.d.usb += watchdog_presc.eq(watchdog_presc + 1)
+        with m.If(watchdog_presc == 0):
+            m.d.usb += watchdog.eq(watchdog + 1)
+        m.d.comb += self.watchdog_expired.eq(watchdog == (watchdog_ticks - 1))
+        kick_watchdog = [watchdog.eq(0), watchdog_presc.eq(0)]
+
+        pid = Signal(DataPID, init=DataPID.DATA0)
+        pending = Signal()
+
+        poll_due = ~self.pause
+        if self._sof_paced:
+            l_sof_frame = Signal(11)
+            poll_due &= self.xfer_status.sof_frame != l_sof_frame
+
+        m.d.comb += [
+            self.xfer.type.eq(TransferType.IN),
+            self.xfer.data_pid.eq(pid),
+            self.xfer.dev_addr.eq(self.dev_addr),
+            self.xfer.ep_addr.eq(self.ep_addr),
+        ]
+
+        with m.FSM(domain="usb") as fsm:
+
+            with m.State("WAIT-ENUMERATION"):
+                with m.If(self.enumerated):
+                    m.d.usb += kick_watchdog  # Kick watchdog on successful enumeration
+                    m.next = "POLL"
+
+            with m.State("POLL"):
+                with m.If(self.xfer_status.idle):
+                    with m.If(pending):
+                        # Previous poll finished, handle the response exactly once.
+                        m.d.usb += pending.eq(0)
+                        with m.Switch(self.xfer_status.response):
+                            with m.Case(TransferResponse.ACK):
+                                # Success: toggle data PID, kick watchdog
+                                m.d.comb += self.ack.eq(1)
+                                m.d.usb += [
+                                    pid.eq(~pid.as_value()),
+                                    *kick_watchdog,
+                                ]
+                            with m.Case(TransferResponse.NAK):
+                                # Device has no data but responded: kick watchdog
+                                m.d.usb += kick_watchdog
+                            with m.Case(TransferResponse.STALL):
+                                # STALL: let watchdog handle recovery
+                                pass
+                    with m.Elif(poll_due):
+                        m.d.comb += self.xfer.start.eq(1)
+                        m.d.usb += pending.eq(1)
+                        if self._sof_paced:
+                            m.d.usb += l_sof_frame.eq(self.xfer_status.sof_frame)
+
+        fsm.state.attrs["fsm_encoding"] = self._FSM_ENCODING
+
+        return m
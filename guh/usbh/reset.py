@@ -63,9 +63,24 @@ class USBResetController(wiring.Component):
 
         # Internal FSM state signals
         reset_counter = Signal(range(4000000))
-        chirp_timer = Signal(16)
         in_idle_state = Signal()
 
+        # PHY overrides requested by the FSM states, decoded once below
+        bus_se0 = Signal()     # Drive SE0 (RAW_DRIVE, HS termination)
+
+        # HS negotiation state only exists if HS is supported. Without it,
+        # there is nothing to clear on the way back to DISCONNECTED.
+        clear_chirp_timer = []
+        if not self.fullspeed_only:
+            # Chirp filter / duration timer. This runs alongside reset_counter,
+            # which keeps timing the whole reset (up to _MAX_RESET_TIME), so it
+            # is a separate counter sized to the longest chirp interval only.
+            chirp_timer = Signal(range(max(self._CHIRP_FILTER_CYCLES, self._CHIRP_DURATION) + 1))
+            chirp_phase = Signal() # Host chirp being sent: K (0) or J (1)
+            clear_chirp_timer = [chirp_timer.eq(0)]
+            host_chirp = Signal()  # Drive host chirp K/J on self.tx
+            hs_phy = Signal()      # HS transceiver and termination
+
         m.d.comb += [
             self.tx.valid.eq(0),
             self.tx.data.eq(0),
@@ -90,11 +105,7 @@ class USBResetController(wiring.Component):
                 # Force SE0 after power-on or watchdog reset, before detecting connections.
                 # XXX/TODO: this seems necessary for reliable re-plugging, even though
                 # it shouldn't be. Figure out how to remove this...
-                m.d.comb += [
-                    self.phy.op_mode.eq(UTMIOperatingModeEnum.RAW_DRIVE),
-                    self.phy.xcvr_select.eq(USBHostSpeed.HIGH),
-                    self.phy.term_select.eq(UTMITerminationSelectEnum.HS_NORMAL),
-                ]
+                m.d.comb += bus_se0.eq(1)
                 with m.If(reset_counter >= self._MAX_RESET_TIME):
                     m.next = "DISCONNECTED"
 
@@ -111,11 +122,7 @@ class USBResetController(wiring.Component):
                     m.next = "DISCONNECTED"
 
             with m.State("BUS-RESET"):
-                m.d.comb += [
-                    self.phy.op_mode.eq(UTMIOperatingModeEnum.RAW_DRIVE),
-                    self.phy.xcvr_select.eq(USBHostSpeed.HIGH),
-                    self.phy.term_select.eq(UTMITerminationSelectEnum.HS_NORMAL),
-                ]
+                m.d.comb += bus_se0.eq(1)
 
                 if not self.fullspeed_only:
                     with m.If(reset_counter >= self._MIN_RESET_BEFORE_CHIRP):
@@ -128,64 +135,45 @@ class USBResetController(wiring.Component):
                             m.d.usb += chirp_timer.eq(0)
 
                 with m.If(reset_counter >= self._MAX_RESET_TIME):
-                    m.d.usb += chirp_timer.eq(0)
+                    m.d.usb += clear_chirp_timer
                     m.next = "IDLE-FS"
 
             if not self.fullspeed_only:
                 with m.State("WAIT-DEVICE-CHIRP-END"):
-                    m.d.comb += [
-                        self.phy.op_mode.eq(UTMIOperatingModeEnum.RAW_DRIVE),
-                        self.phy.xcvr_select.eq(USBHostSpeed.HIGH),
-                        self.phy.term_select.eq(UTMITerminationSelectEnum.HS_NORMAL),
-                    ]
+                    m.d.comb += bus_se0.eq(1)
 
                     with m.If(self.phy.line_state != UTMILineState.K):
                         m.d.usb += chirp_timer.eq(0)
                         m.next = "WAIT-DEVICE-CHIRP-END-SE0"
 
                 with m.State("WAIT-DEVICE-CHIRP-END-SE0"):
-                    m.d.comb += [
-                        self.phy.op_mode.eq(UTMIOperatingModeEnum.RAW_DRIVE),
-                        self.phy.xcvr_select.eq(USBHostSpeed.HIGH),
-                        self.phy.term_select.eq(UTMITerminationSelectEnum.HS_NORMAL),
-                    ]
+                    m.d.comb += bus_se0.eq(1)
 
                     m.d.usb += chirp_timer.eq(chirp_timer + 1)
                     with m.If(chirp_timer == self._CHIRP_DURATION):
-                        m.d.usb += chirp_timer.eq(0)
-                        m.next = "SEND-HOST-CHIRP-K"
-
-                with m.State("SEND-HOST-CHIRP-K"):
+                        m.d.usb += [
+                            chirp_timer.eq(0),
+                            chirp_phase.eq(0),
+                        ]
+                        m.next = "SEND-HOST-CHIRP"
+
+                # Alternate host chirp K (phase 0) and J (phase 1), ending
+                # after a J once the reset time is up.
+                with m.State("SEND-HOST-CHIRP"):
                     m.d.comb += [
-                        self.phy.op_mode.eq(UTMIOperatingModeEnum.CHIRP),
-                        self.phy.xcvr_select.eq(USBHostSpeed.HIGH),
-                        self.phy.term_select.eq(UTMITerminationSelectEnum.HS_NORMAL),
-                        self.tx.valid.eq(1),
-                        self.tx.data.eq(0x00),
-                    ]
-
-                    m.d.usb += chirp_timer.eq(chirp_timer + 1)
-                    with m.If(chirp_timer >= self._CHIRP_DURATION):
-                        m.d.usb += chirp_timer.eq(0)
-                        m.next = "SEND-HOST-CHIRP-J"
-
-                with m.State("SEND-HOST-CHIRP-J"):
-                    m.d.comb += [
-                        self.phy.op_mode.eq(UTMIOperatingModeEnum.CHIRP),
-                        self.phy.xcvr_select.eq(USBHostSpeed.HIGH),
-                        self.phy.term_select.eq(UTMITerminationSelectEnum.HS_NORMAL),
-                        self.tx.valid.eq(1),
-                        self.tx.data.eq(0xff),
+                        host_chirp.eq(1),
+                        self.tx.data.eq(chirp_phase.replicate(8)),
                     ]
 
                     m.d.usb += chirp_timer.eq(chirp_timer + 1)
 
                     with m.If(chirp_timer >= self._CHIRP_DURATION):
-                        m.d.usb += chirp_timer.eq(0)
-                        with m.If(reset_counter >= self._MAX_RESET_TIME):
+                        m.d.usb += [
+                            chirp_timer.eq(0),
+                            chirp_phase.eq(~chirp_phase),
+                        ]
+                        with m.If(chirp_phase & (reset_counter >= self._MAX_RESET_TIME)):
                             m.next = "IDLE-HS"
-                        with m.Else():
-                            m.next = "SEND-HOST-CHIRP-K"
 
             with m.State("IDLE-FS"):
                 m.d.comb += [
@@ -195,7 +183,7 @@ class USBResetController(wiring.Component):
                 ]
 
                 with m.If(self.bus_reset):
-                    m.d.usb += chirp_timer.eq(0)
+                    m.d.usb += clear_chirp_timer
                     m.next = "DISCONNECTED"
 
             if not self.fullspeed_only:
@@ -204,12 +192,28 @@ class USBResetController(wiring.Component):
                         in_idle_state.eq(1),
                         self.reset_active.eq(0),
                         self.detected_speed.eq(USBHostSpeed.HIGH),
-                        self.phy.xcvr_select.eq(USBHostSpeed.HIGH),
-                        self.phy.term_select.eq(UTMITerminationSelectEnum.HS_NORMAL),
+                        hs_phy.eq(1),
                     ]
 
                     with m.If(self.bus_reset):
                         m.d.usb += chirp_timer.eq(0)
                         m.next = "DISCONNECTED"
 
+        hs_select = bus_se0
+        if not self.fullspeed_only:
+            hs_select = hs_select | host_chirp | hs_phy
+        with m.If(hs_select):
+            m.d.comb += [
+                self.phy.xcvr_select.eq(USBHostSpeed.HIGH),
+                self.phy.term_select.eq(UTMITerminationSelectEnum.HS_NORMAL),
+            ]
+        with m.If(bus_se0):
+            m.d.comb += self.phy.op_mode.eq(UTMIOperatingModeEnum.RAW_DRIVE)
+        if not self.fullspeed_only:
+            with m.If(host_chirp):
+                m.d.comb += [
+                    self.phy.op_mode.eq(UTMIOperatingModeEnum.CHIRP),
+                    self.tx.valid.eq(1),
+                ]
+
         return m
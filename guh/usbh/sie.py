@@ -123,14 +123,16 @@ class USBTokenPacketGenerator(wiring.Component):
         m = Module()
 
         pkt = Signal(shape=TokenPayload)
+        crc5 = Signal(5) # Registered during SEND_PAYLOAD0, sent in SEND_PAYLOAD1
 
-        long_txa_post_transmit_cnt = Signal(range(self._LONG_TXA_POST_TRANSMIT_FS+1))
+        # Counts down the long post-transmit time in WAIT-LONG-TXA
+        long_txa_cnt = Signal(range(self._LONG_TXA_POST_TRANSMIT_FS+1))
 
         with m.FSM(domain="usb"):
 
             with m.State('IDLE'):
                 m.d.comb += self.i.ready.eq(1)
-                m.d.usb += long_txa_post_transmit_cnt.eq(
+                m.d.usb += long_txa_cnt.eq(
                     Mux(self.speed==USBHostSpeed.HIGH,
                             self._LONG_TXA_POST_TRANSMIT_HS,
                             self._LONG_TXA_POST_TRANSMIT_FS
@@ -141,17 +143,12 @@ class USBTokenPacketGenerator(wiring.Component):
 
             with m.State('SEND_PID'):
 
-                with m.Switch(pkt.pid):
-                    with m.Case(TokenPID.OUT):
-                        m.d.comb += self.tx.data.eq(USBPacketID.OUT.byte()),
-                    with m.Case(TokenPID.IN):
-                        m.d.comb += self.tx.data.eq(USBPacketID.IN.byte()),
-                    with m.Case(TokenPID.SOF):
-                        m.d.comb += self.tx.data.eq(USBPacketID.SOF.byte()),
-                    with m.Case(TokenPID.SETUP):
-                        m.d.comb += self.tx.data.eq(USBPacketID.SETUP.byte()),
-
-                m.d.comb += self.tx.valid.eq(1),
+                # TokenPID values are the PID nibble, so the PID byte on the
+                # wire is just the nibble followed by its complement.
+                m.d.comb += [
+                    self.tx.data .eq(Cat(pkt.pid.as_value(), ~pkt.pid.as_value())),
+                    self.tx.valid.eq(1),
+                ]
 
                 with m.If(self.tx.ready):
                     m.next = 'SEND_PAYLOAD0'
@@ -161,13 +158,12 @@ class USBTokenPacketGenerator(wiring.Component):
                     self.tx.data .eq(pkt.data.as_value()[0:8]),
                     self.tx.valid.eq(1),
                 ]
+                m.d.usb += crc5.eq(USBTokenDetector._generate_crc_for_token(pkt.data.as_value()))
                 with m.If(self.tx.ready):
                     m.next = 'SEND_PAYLOAD1'
 
             with m.State('SEND_PAYLOAD1'):
-                crc5 = Signal(5)
                 m.d.comb += [
-                    crc5.eq(USBTokenDetector._generate_crc_for_token(pkt.data.as_value())),
                     self.tx.data .eq(Cat(pkt.data.as_value()[8:11], crc5)),
                     self.tx.valid.eq(1),
                 ]
@@ -184,11 +180,9 @@ class USBTokenPacketGenerator(wiring.Component):
                     m.next = 'IDLE'
 
             with m.State('WAIT-LONG-TXA'):
-                cnt = Signal.like(long_txa_post_transmit_cnt)
-                m.d.usb += cnt.eq(cnt+1)
-                with m.If(cnt == long_txa_post_transmit_cnt):
+                m.d.usb += long_txa_cnt.eq(long_txa_cnt - 1)
+                with m.If(long_txa_cnt == 0):
                     m.d.comb += self.txa.eq(1)
-                    m.d.usb += cnt.eq(0)
                     m.next = 'IDLE'
 
         return m
@@ -245,27 +239,38 @@ class USBSOFController(wiring.Component):
         frame_number = Signal(11)
         microframe_number = Signal(3)
 
-        # Dynamic timing constants based on speed
-        sof_cycles = Signal(16)
-        tx_to_tx_min = Signal(16)
-        tx_to_tx_max = Signal(16)
-        tx_to_rx_max = Signal(16)
+        # Timing constants based on speed. These are registered: speed only
+        # changes across a bus reset, so selecting them a cycle late is free,
+        # and it keeps the speed mux out of the timer compare paths.
+        # All are stored minus one, as they are compared against a timer or
+        # down-counter that is one cycle ahead of the registered outputs.
+        sof_last = Signal(16, init=self._SOF_CYCLES_FS - 1)
+        tx_to_tx_min = Signal(16, init=self._SOF_TX_TO_TX_MIN_FS - 1)
+        tx_to_tx_max = Signal(16, init=self._SOF_TX_TO_TX_MAX_FS - 1)
+        tx_to_rx_max = Signal(16, init=self._SOF_TX_TO_RX_MAX_FS - 1)
 
         with m.If(self.speed == USBHostSpeed.HIGH):
-            m.d.comb += [
-                sof_cycles.eq(self._SOF_CYCLES_HS),
-                tx_to_tx_min.eq(self._SOF_TX_TO_TX_MIN_HS),
-                tx_to_tx_max.eq(self._SOF_TX_TO_TX_MAX_HS),
-                tx_to_rx_max.eq(self._SOF_TX_TO_RX_MAX_HS),
+            m.d.usb += [
+                sof_last.eq(self._SOF_CYCLES_HS - 1),
+                tx_to_tx_min.eq(self._SOF_TX_TO_TX_MIN_HS - 1),
+                tx_to_tx_max.eq(self._SOF_TX_TO_TX_MAX_HS - 1),
+                tx_to_rx_max.eq(self._SOF_TX_TO_RX_MAX_HS - 1),
             ]
         with m.Else():
-            m.d.comb += [
-                sof_cycles.eq(self._SOF_CYCLES_FS),
-                tx_to_tx_min.eq(self._SOF_TX_TO_TX_MIN_FS),
-                tx_to_tx_max.eq(self._SOF_TX_TO_TX_MAX_FS),
-                tx_to_rx_max.eq(self._SOF_TX_TO_RX_MAX_FS),
+            m.d.usb += [
+                sof_last.eq(self._SOF_CYCLES_FS - 1),
+                tx_to_tx_min.eq(self._SOF_TX_TO_TX_MIN_FS - 1),
+                tx_to_tx_max.eq(self._SOF_TX_TO_TX_MAX_FS - 1),
+                tx_to_rx_max.eq(self._SOF_TX_TO_RX_MAX_FS - 1),
             ]
 
+        # Window edges, counted down from each SOF. These start saturated so
+        # that no window opens before the first SOF is sent, as the
+        # thresholds for the detected speed are only loaded at that point.
+        cnt_tx_open = Signal(16, init=2**16-1)
+        cnt_tx_close = Signal(16, init=2**16-1)
+        cnt_rx_close = Signal(16, init=2**16-1)
+
         m.d.usb += sof_timer.eq(sof_timer + 1)
 
         m.d.comb += [
@@ -273,21 +278,32 @@ class USBSOFController(wiring.Component):
             self.o.payload.data.eq(frame_number),
         ]
 
-        m.d.comb += self.txa.eq(
-            (sof_timer >= tx_to_tx_min) &
-            (sof_timer < tx_to_tx_max)
-        )
-
-        m.d.comb += self.rxa.eq(
-            (sof_timer >= tx_to_tx_min) &
-            (sof_timer < tx_to_rx_max)
-        )
+        # `txa` and `rxa` are flops, set when the window opens and cleared
+        # when it closes. The counters stop at zero, so later edges (the
+        # closes) must come after the open in here to take priority.
+        for cnt in (cnt_tx_open, cnt_tx_close, cnt_rx_close):
+            with m.If(cnt != 0):
+                m.d.usb += cnt.eq(cnt - 1)
+        with m.If(cnt_tx_open == 0):
+            m.d.usb += [
+                self.txa.eq(1),
+                self.rxa.eq(1),
+            ]
+        with m.If(cnt_tx_close == 0):
+            m.d.usb += self.txa.eq(0)
+        with m.If(cnt_rx_close == 0):
+            m.d.usb += self.rxa.eq(0)
 
         with m.FSM(domain="usb"):
 
             with m.State('IDLE'):
-                with m.If(sof_timer == (sof_cycles - 1)):
-                    m.d.usb += sof_timer.eq(0)
+                with m.If(sof_timer == sof_last):
+                    m.d.usb += [
+                        sof_timer.eq(0),
+                        cnt_tx_open.eq(tx_to_tx_min),
+                        cnt_tx_close.eq(tx_to_tx_max),
+                        cnt_rx_close.eq(tx_to_rx_max),
+                    ]
 
                     with m.If(self.speed == USBHostSpeed.HIGH):
                         m.d.usb += microframe_number.eq(microframe_number + 1)
@@ -468,10 +484,16 @@ class USBSIE(wiring.Component):
         rx_len = Signal(8)
         response = Signal(TransferResponse)
         tx_len = Signal(8)  # Captured from TX FIFO level at transfer start
-        tx_byte_count = Signal(16)
+        tx_level = Signal(range(self.fifo_depth + 1))  # Tracks TX FIFO level
+        tx_byte_count = Signal.like(tx_len)
+        ipd = Signal(range(self._XFER_IPD_FS))  # Counts down in IPD_DRAIN_TX
 
         # SIE token stream for multiplexing with SOF. SOF has priority when SIE is idle
         sie_token = stream.Signature(TokenPayload).create()
+
+        # Token PID for each TransferType, indexed directly by `xfer.type`.
+        # This is possible as long as we don't support iso
+        token_pids = Array([TokenPID.SETUP, TokenPID.IN, TokenPID.OUT, TokenPID.SETUP])
         m.d.comb += [
             token_generator.i.valid.eq(Mux(send_sofs,
                                            sof_controller.o.valid,
@@ -483,20 +505,37 @@ class USBSIE(wiring.Component):
             sie_token.ready.eq(~send_sofs & token_generator.i.ready),
         ]
 
+        # Count TX FIFO writes and reads here, rather than sampling the FIFO's
+        # own w_level, which is derived from its pointers.
+        m.d.usb += tx_level.eq(tx_level
+                               + (tx_fifo.w_en & tx_fifo.w_rdy)
+                               - (tx_fifo.r_en & tx_fifo.r_rdy))
+
         m.d.comb += [
             self.ctrl.status.rx_len.eq(rx_len),
             self.ctrl.status.response.eq(response),
             self.ctrl.status.sof_frame.eq(sof_controller.o.payload.data),
         ]
 
+        # PHY configuration outside of reset. Registered, as the detected
+        # speed only changes while the reset controller is driving the PHY.
+        xcvr_select = Signal(USBHostSpeed, init=USBHostSpeed.FULL)
+        term_select = Signal(UTMITerminationSelectEnum, init=UTMITerminationSelectEnum.LS_FS_NORMAL)
+        with m.If(detected_speed == USBHostSpeed.HIGH):
+            m.d.usb += [
+                xcvr_select.eq(USBHostSpeed.HIGH),
+                term_select.eq(UTMITerminationSelectEnum.HS_NORMAL),
+            ]
+        with m.Else():
+            m.d.usb += [
+                xcvr_select.eq(USBHostSpeed.FULL),
+                term_select.eq(UTMITerminationSelectEnum.LS_FS_NORMAL),
+            ]
+
         m.d.comb += [
             self.utmi.op_mode.eq(UTMIOperatingModeEnum.NORMAL),
-            self.utmi.xcvr_select.eq(Mux(detected_speed == USBHostSpeed.HIGH,
-                                         USBHostSpeed.HIGH,
-                                         USBHostSpeed.FULL)),
-            self.utmi.term_select.eq(Mux(detected_speed == USBHostSpeed.HIGH,
-                                         UTMITerminationSelectEnum.HS_NORMAL,
-                                         UTMITerminationSelectEnum.LS_FS_NORMAL)),
+            self.utmi.xcvr_select.eq(xcvr_select),
+            self.utmi.term_select.eq(term_select),
         ]
 
         with m.FSM(domain="usb") as fsm:
@@ -521,11 +560,19 @@ class USBSIE(wiring.Component):
                     m.d.usb += [
                         xfer.eq(self.ctrl.xfer),
                         tx_byte_count.eq(0),
+                        ipd.eq(Mux(detected_speed == USBHostSpeed.HIGH,
+                                   self._XFER_IPD_HS, self._XFER_IPD_FS) - 1),
                         rx_len.eq(0),
                         response.eq(TransferResponse.NONE),
-                        tx_len.eq(tx_fifo.w_level),  # Capture TX FIFO level
+                        tx_len.eq(tx_level),  # Capture TX FIFO level
                     ]
-                    m.next = "DRAIN_RX"
+                    # Only take the extra DRAIN_RX trip if the controller left
+                    # bytes behind. The RX FIFO cannot be drained in IDLE
+                    # itself, as that is where the controller reads it.
+                    with m.If(rx_fifo.r_rdy):
+                        m.next = "DRAIN_RX"
+                    with m.Else():
+                        m.next = "WAIT_TXA"
 
             with m.State("DRAIN_RX"):
                 m.d.comb += send_sofs.eq(1)
@@ -540,20 +587,9 @@ class USBSIE(wiring.Component):
                     m.next = "SEND_TOKEN"
 
             with m.State("SEND_TOKEN"):
-                # Derive token PID from transfer type
-                # This is possible as long as we don't support iso
-                token_pid = Signal(TokenPID, init=TokenPID.SETUP)
-                with m.Switch(xfer.type):
-                    with m.Case(TransferType.SETUP):
-                        m.d.comb += token_pid.eq(TokenPID.SETUP)
-                    with m.Case(TransferType.IN):
-                        m.d.comb += token_pid.eq(TokenPID.IN)
-                    with m.Case(TransferType.OUT):
-                        m.d.comb += token_pid.eq(TokenPID.OUT)
-
                 m.d.comb += [
                     sie_token.valid.eq(1),
-                    sie_token.payload.pid.eq(token_pid),
+                    sie_token.payload.pid.eq(token_pids[xfer.type.as_value()]),
                     sie_token.payload.data.addr.eq(xfer.dev_addr),
                     sie_token.payload.data.endp.eq(xfer.ep_addr),
                 ]
@@ -608,37 +644,39 @@ class USBSIE(wiring.Component):
                     with m.Else():
                         m.d.usb += response.eq(TransferResponse.RX_OVERFLOW)
                     m.d.usb += rx_len.eq(rx_len + 1)
-                with m.If(receiver.ready_for_response):
+                # Outcomes in priority order, highest first.
+                with m.If(~sof_controller.rxa):
+                    m.d.usb += response.eq(TransferResponse.TIMEOUT)
+                    m.next = "IPD_DRAIN_TX"
+                with m.Elif(handshake_detector.detected.stall):
+                    m.d.usb += response.eq(TransferResponse.STALL)
+                    m.next = "IPD_DRAIN_TX"
+                with m.Elif(handshake_detector.detected.nak):
+                    m.d.usb += response.eq(TransferResponse.NAK)
+                    m.next = "IPD_DRAIN_TX"
+                with m.Elif(receiver.crc_mismatch):
+                    m.d.usb += response.eq(TransferResponse.CRC_ERROR)
+                    m.next = "IPD_DRAIN_TX"
+                with m.Elif(receiver.ready_for_response):
                     with m.If(response == TransferResponse.RX_OVERFLOW):
                         m.next = "IPD_DRAIN_TX"
                     with m.Else():
                         # TODO: not correct for iso transfers
                         m.next = "SEND_ACK"
-                with m.If(receiver.crc_mismatch):
-                    m.d.usb += response.eq(TransferResponse.CRC_ERROR)
-                    m.next = "IPD_DRAIN_TX"
-                with m.If(handshake_detector.detected.nak):
-                    m.d.usb += response.eq(TransferResponse.NAK)
-                    m.next = "IPD_DRAIN_TX"
-                with m.If(handshake_detector.detected.stall):
-                    m.d.usb += response.eq(TransferResponse.STALL)
-                    m.next = "IPD_DRAIN_TX"
+
+            with m.State("WAIT_HANDSHAKE"):
+                # Outcomes in priority order, highest first.
                 with m.If(~sof_controller.rxa):
                     m.d.usb += response.eq(TransferResponse.TIMEOUT)
                     m.next = "IPD_DRAIN_TX"
-
-            with m.State("WAIT_HANDSHAKE"):
-                with m.If(handshake_detector.detected.ack):
-                    m.d.usb += response.eq(TransferResponse.ACK)
+                with m.Elif(handshake_detector.detected.stall):
+                    m.d.usb += response.eq(TransferResponse.STALL)
                     m.next = "IPD_DRAIN_TX"
-                with m.If(handshake_detector.detected.nak):
+                with m.Elif(handshake_detector.detected.nak):
                     m.d.usb += response.eq(TransferResponse.NAK)
                     m.next = "IPD_DRAIN_TX"
-                with m.If(handshake_detector.detected.stall):
-                    m.d.usb += response.eq(TransferResponse.STALL)
-                    m.next = "IPD_DRAIN_TX"
-                with m.If(~sof_controller.rxa):
-                    m.d.usb += response.eq(TransferResponse.TIMEOUT)
+                with m.Elif(handshake_detector.detected.ack):
+                    m.d.usb += response.eq(TransferResponse.ACK)
                     m.next = "IPD_DRAIN_TX"
 
             with m.State("SEND_ACK"):
@@ -649,13 +687,11 @@ class USBSIE(wiring.Component):
 
             with m.State("IPD_DRAIN_TX"):
                 # Post-transaction interpacket delay while draining TX FIFO
-                ipd_max = Mux(detected_speed == USBHostSpeed.HIGH,
-                              self._XFER_IPD_HS, self._XFER_IPD_FS)
-                ipd = Signal(range(self._XFER_IPD_FS), init=0)
-                m.d.usb += ipd.eq(ipd+1)
+                # (the delay is loaded when the transfer starts)
+                with m.If(ipd != 0):
+                    m.d.usb += ipd.eq(ipd - 1)
                 m.d.comb += tx_fifo.r_en.eq(tx_fifo.r_rdy)
-                with m.If((ipd == (ipd_max-1)) & ~tx_fifo.r_rdy):
-                    m.d.usb += ipd.eq(0)
+                with m.If((ipd == 0) & ~tx_fifo.r_rdy):
                     m.next = "IDLE"
 
         return m
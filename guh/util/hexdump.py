@@ -17,73 +17,69 @@ class HexDump(wiring.Component):
     i: In(stream.Signature(Packet(unsigned(8))))
     tx: Out(unsigned(1))
 
+    # Separators sent after each byte's hex digits, first character in the LSBs.
+    _SPACE = C(ord(' '), 8)
+    _EOL   = C(int.from_bytes(b"\r\n", "little"), 16)
+
     def __init__(self, *, divisor, bytes_per_line=16):
         self._divisor = divisor
         self._bytes_per_line = bytes_per_line
         super().__init__()
 
+    @staticmethod
+    def _hex_char(nibble):
+        # '0'-'9' and 'A'-'F' are contiguous, so offset rather than look up.
+        return nibble + Mux(nibble < 10, ord('0'), ord('A') - 10)
+
     def elaborate(self, platform):
         m = Module()
 
         m.submodules.uart = uart = UARTTransmitter(divisor=self._divisor)
         m.d.comb += self.tx.eq(uart.tx)
 
-        hex_chars = Array([ord(c) for c in "0123456789ABCDEF"])
-
-        byte_latch = Signal(8)
+        # Characters still to send for the current byte, LSB first: its two
+        # hex digits, then a space, or CR/LF at the end of a line.
+        pending = Signal(32)
+        pending_cnt = Signal(range(5))
         byte_count = Signal(range(self._bytes_per_line + 1))
 
+        hex_hi = Signal(8)
+        hex_lo = Signal(8)
+        m.d.comb += [
+            hex_hi.eq(self._hex_char(self.i.payload.data[4:8])),
+            hex_lo.eq(self._hex_char(self.i.payload.data[0:4])),
+        ]
+
         with m.FSM():
 
             with m.State("IDLE"):
                 m.d.comb += self.i.ready.eq(1)
                 with m.If(self.i.valid):
-                    m.d.sync += byte_latch.eq(self.i.payload.data)
-                    m.next = "SEND-HIGH"
-
-            with m.State("SEND-HIGH"):
-                m.d.comb += [
-                    uart.stream.valid.eq(1),
-                    uart.stream.payload.eq(hex_chars[byte_latch[4:8]]),
-                ]
-                with m.If(uart.stream.ready):
-                    m.next = "SEND-LOW"
-
-            with m.State("SEND-LOW"):
-                m.d.comb += [
-                    uart.stream.valid.eq(1),
-                    uart.stream.payload.eq(hex_chars[byte_latch[0:4]]),
-                ]
-                with m.If(uart.stream.ready):
                     m.d.sync += byte_count.eq(byte_count + 1)
                     with m.If(byte_count == (self._bytes_per_line - 1)):
-                        m.d.sync += byte_count.eq(0)
-                        m.next = "SEND-CR"
+                        m.d.sync += [
+                            byte_count.eq(0),
+                            pending.eq(Cat(hex_hi, hex_lo, self._EOL)),
+                            pending_cnt.eq(4),
+                        ]
                     with m.Else():
-                        m.next = "SEND-SPACE"
-
-            with m.State("SEND-SPACE"):
-                m.d.comb += [
-                    uart.stream.valid.eq(1),
-                    uart.stream.payload.eq(ord(' ')),
-                ]
-                with m.If(uart.stream.ready):
-                    m.next = "IDLE"
-
-            with m.State("SEND-CR"):
-                m.d.comb += [
-                    uart.stream.valid.eq(1),
-                    uart.stream.payload.eq(ord('\r')),
-                ]
-                with m.If(uart.stream.ready):
-                    m.next = "SEND-LF"
+                        m.d.sync += [
+                            pending.eq(Cat(hex_hi, hex_lo, self._SPACE)),
+                            pending_cnt.eq(3),
+                        ]
+                    m.next = "EMIT"
 
-            with m.State("SEND-LF"):
+            with m.State("EMIT"):
                 m.d.comb += [
                     uart.stream.valid.eq(1),
-                    uart.stream.payload.eq(ord('\n')),
+                    uart.stream.payload.eq(pending[0:8]),
                 ]
                 with m.If(uart.stream.ready):
-                    m.next = "IDLE"
+                    m.d.sync += [
+                        pending.eq(pending >> 8),
+                        pending_cnt.eq(pending_cnt - 1),
+                    ]
+                    with m.If(pending_cnt == 1):
+                        m.next = "IDLE"
 
         return m
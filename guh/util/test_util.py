@@ -5,11 +5,14 @@
 Shared test fixtures and utilities for USB Host tests.
 """
 
+import contextlib
+import functools
+import os
 import struct
 
 from amaranth import *
 from amaranth.lib import enum, stream
-from amaranth.sim import SimulatorContext
+from amaranth.sim import Simulator, SimulatorContext
 
 from colorama import Fore, Style
 
@@ -159,7 +162,8 @@ def prettyprint_packet(prefix, timestamp_ns, packet):
 
 def make_packet_capture_process(hst_utmi, dev_utmi, bus_event, pcap_filename):
     """
-    Create a packet capture process that monitors UTMI traffic and writes to pcap.
+    Create a packet capture process that monitors UTMI traffic and writes to pcap
+    (only if the GUH_VCD environment variable is set, like `maybe_write_vcd`).
     Returns an async coroutine suitable for sim.add_process().
     """
     async def process(ctx):
@@ -168,9 +172,9 @@ def make_packet_capture_process(hst_utmi, dev_utmi, bus_event, pcap_filename):
         cycle_count = 0
         last_bus_event = None
 
-        pcap = USBPcapWriter(pcap_filename)
-        try:
-            pcap.__enter__()
+        # Closed when the simulator drops this (never-ending) process.
+        pcap_writer = USBPcapWriter(pcap_filename) if tracing_enabled() else contextlib.nullcontext()
+        with pcap_writer as pcap:
             while True:
                 timestamp_ns = int(1e9*(cycle_count/60e6))
                 _, _, dev_rxv, dev_rxa, dev_rxd, hst_rxv, hst_rxa, hst_rxd, evt = await ctx.tick().sample(
@@ -189,33 +193,58 @@ def make_packet_capture_process(hst_utmi, dev_utmi, bus_event, pcap_filename):
                     packet_hst.append(int(dev_rxd))
                 if packet_hst and not dev_rxa:
                     prettyprint_packet(f"{Fore.GREEN}HST{Style.RESET_ALL}", timestamp_ns, packet_hst)
-                    pcap.write_packet(timestamp_ns, packet_hst)
+                    if pcap:
+                        pcap.write_packet(timestamp_ns, packet_hst)
                     packet_hst = []
                 # Monitor Device->Host traffic
                 if hst_rxv:
                     packet_dev.append(int(hst_rxd))
                 if packet_dev and not hst_rxa:
                     prettyprint_packet(f"{Fore.RED}DEV{Style.RESET_ALL}", timestamp_ns, packet_dev)
-                    pcap.write_packet(timestamp_ns, packet_dev)
+                    if pcap:
+                        pcap.write_packet(timestamp_ns, packet_dev)
                     packet_dev = []
                 cycle_count += 1
-        finally:
-            pcap.__exit__(None, None, None)
     return process
 
 
-_usb_timing_patched = False
+def tracing_enabled():
+    """
+    Simulation traces (VCD and pcap) are only written if the GUH_VCD
+    environment variable is set, so test runs don't litter the working
+    directory (and VCD tracing dominates simulation time).
+    """
+    return bool(os.environ.get("GUH_VCD"))
+
+
+def maybe_write_vcd(sim, filename):
+    """
+    Trace the simulation to a VCD, but only if `tracing_enabled()`.
+    """
+    if tracing_enabled():
+        return sim.write_vcd(vcd_file=filename)
+    return contextlib.nullcontext()
+
 
+def run_simulation(dut, testbench, *, vcd_filename, clock_period=1e-6, processes=()):
+    """
+    Simulate `dut` with a single clock until `testbench` returns. Any
+    `processes` run alongside it in the background.
+    """
+    sim = Simulator(dut)
+    sim.add_clock(clock_period)
+    sim.add_testbench(testbench)
+    for process in processes:
+        sim.add_process(process)
+    with maybe_write_vcd(sim, vcd_filename):
+        sim.run()
 
+
+# This should only run once per context, otherwise timing gets super broken
+@functools.cache
 def patch_usb_timing_for_simulation():
     """Patch USB timing constants for faster simulation."""
 
-    # This should only run once per context, otherwise timing gets super broken
-    global _usb_timing_patched
-    if _usb_timing_patched:
-        return
-    _usb_timing_patched = True
-
     from luna.gateware.usb.usb2.reset import USBResetSequencer
     from guh.usbh.reset import USBResetController
     from guh.usbh.sie import USBSOFController
@@ -236,7 +265,7 @@ def patch_usb_timing_for_simulation():
     USBSOFController._SOF_TX_TO_TX_MIN_HS //= 2
     USBSOFController._SOF_TX_TO_TX_MAX_HS = USBSOFController._SOF_CYCLES_HS - 900
     USBSOFController._SOF_TX_TO_RX_MAX_HS = USBSOFController._SOF_CYCLES_HS - 60
-    USBHostEnumerator._SOF_DELAY_RDY = 1 # only wait for one SOF on startup
+    USBHostEnumerator._SOF_DELAY_LOG2 = 0 # only wait for one SOF on startup
 
 
 # Stream test helpers lifted from:
@@ -255,3 +284,11 @@ async def get(ctx: SimulatorContext, strm: stream.Interface):
     payload, = await ctx.tick().sample(strm.payload).until(strm.valid == 1)
     ctx.set(strm.ready, 0)
     return payload
+
+async def put_many(ctx: SimulatorContext, strm: stream.Interface, payloads):
+    # Like `put`, but holds `valid` across a whole sequence of payloads.
+    ctx.set(strm.valid, 1)
+    for payload in payloads:
+        ctx.set(strm.payload, payload)
+        await ctx.tick().until(strm.ready == 1)
+    ctx.set(strm.valid, 0)
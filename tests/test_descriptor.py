@@ -5,6 +5,7 @@
 Tests for USB descriptor endpoint extraction.
 """
 
+import pathlib
 import unittest
 
 from amaranth import *
@@ -18,73 +19,146 @@ from guh.usbh.descriptor import *
 # Usually the host engine itself defines its own parser for the
 # types of endpoints it is looking for.
 
-MIDIDescriptorParser = lambda: USBDescriptorParser(
+MIDIDescriptorParser = lambda debug=False: USBDescriptorParser(
     endpoint_filter=EndpointFilter.IN_AND_OUT,
     transfer_type=EndpointTransferType.BULK,
     interface_class=InterfaceClass.AUDIO,
     interface_subclass=AudioSubClass.MIDISTREAMING,
     interface_protocol=AudioProtocol.AUDIO_1_0,
+    debug=debug,
 )
 
-MSCDescriptorParser = lambda: USBDescriptorParser(
+MSCDescriptorParser = lambda debug=False: USBDescriptorParser(
     endpoint_filter=EndpointFilter.IN_AND_OUT,
     transfer_type=EndpointTransferType.BULK,
     interface_class=InterfaceClass.MASS_STORAGE,
     interface_subclass=MSCSubClass.SCSI_TRANSPARENT,
     interface_protocol=MSCProtocol.BULK_ONLY,
+    debug=debug,
 )
 
-HIDKeyboardDescriptorParser = lambda: USBDescriptorParser(
+HIDKeyboardDescriptorParser = lambda debug=False: USBDescriptorParser(
     endpoint_filter=EndpointFilter.IN,
     transfer_type=EndpointTransferType.INTERRUPT,
     interface_class=InterfaceClass.HID,
     interface_subclass=HIDSubClass.BOOT_INTERFACE,
     interface_protocol=HIDProtocol.KEYBOARD,
+    debug=debug,
 )
 
-HIDMouseDescriptorParser = lambda: USBDescriptorParser(
+HIDMouseDescriptorParser = lambda debug=False: USBDescriptorParser(
     endpoint_filter=EndpointFilter.IN,
     transfer_type=EndpointTransferType.INTERRUPT,
     interface_class=InterfaceClass.HID,
     interface_subclass=HIDSubClass.BOOT_INTERFACE,
     interface_protocol=HIDProtocol.MOUSE,
+    debug=debug,
 )
 
+# Raw configuration descriptors captured from real devices, by name.
+DESCRIPTORS = {
+    path.stem: path.read_bytes()
+    for path in pathlib.Path("tests/data/usbdesc_config").glob("*.bin")
+}
+
+# Builders for synthetic descriptors, covering layouts the captures don't.
+
+def config_descriptor(*descriptors):
+    body = b"".join(descriptors)
+    total_length = 9 + len(body)
+    return bytes([9, DescriptorType.CONFIG.value, *total_length.to_bytes(2, "little"),
+                  1, 1, 0, 0x80, 50]) + body
+
+def interface_descriptor(interface_class, subclass, protocol, num_endpoints=1):
+    return bytes([9, DescriptorType.INTERFACE.value, 0, 0, num_endpoints,
+                  interface_class.value, subclass.value, protocol.value, 0])
+
+def endpoint_descriptor(address, attributes):
+    return bytes([7, DescriptorType.ENDPOINT.value, address, attributes, 8, 0, 10])
+
+HID_MOUSE_INTERFACE = interface_descriptor(
+    InterfaceClass.HID, HIDSubClass.BOOT_INTERFACE, HIDProtocol.MOUSE)
+INTERRUPT_IN_1 = endpoint_descriptor(0x81, 0x03)
+
+# The wanted endpoint is the last byte of the configuration descriptor.
+DESCRIPTORS["synthetic_endpoint_last"] = config_descriptor(
+    HID_MOUSE_INTERFACE, INTERRUPT_IN_1)
+# Malformed bLength (0 or 1) ends parsing. The match is placed where a
+# parser taking the (wrapped) bLength - 2 at face value would resync.
+for bad_length in (0, 1):
+    DESCRIPTORS[f"synthetic_blength{bad_length}"] = config_descriptor(
+        bytes([bad_length, DescriptorType.INTERFACE.value]),
+        bytes((bad_length - 2) % 256),
+        HID_MOUSE_INTERFACE, INTERRUPT_IN_1)
+# A match after wTotalLength is not part of the configuration.
+DESCRIPTORS["synthetic_past_total_length"] = config_descriptor(
+    interface_descriptor(InterfaceClass.HID, HIDSubClass.BOOT_INTERFACE, HIDProtocol.KEYBOARD),
+    endpoint_descriptor(0x82, 0x03)) + HID_MOUSE_INTERFACE + INTERRUPT_IN_1
+
+# name, parser, expected IN endpoint, expected OUT endpoint
+PARSER_CASES = [
+    ["arturia_keylabmkii", MIDIDescriptorParser, 1, 2],
+    ["oxi_one",            MIDIDescriptorParser, 1, 1],
+    ["yamaha_cp73",        MIDIDescriptorParser, 2, 3],
+    ["yamaha_pssa50",      MIDIDescriptorParser, 2, 1],
+    ["android_uac_midi",   MIDIDescriptorParser, 1, 1],
+    ["korg_microkey2",     MIDIDescriptorParser, 2, 1],
+    ["sandisk_32gen1",     MSCDescriptorParser, 1, 2],
+    ["samsung_ssd_t5",     MSCDescriptorParser, 1, 2],
+    ["anker_cardreader",   MSCDescriptorParser, 2, 1],
+    ["logi_g502",          HIDMouseDescriptorParser, 1, None],
+    # dual-function wireless receivers (keyboard and mouse, we selecting one function)
+    ["logi_rec1",          HIDMouseDescriptorParser, 2, None],
+    ["logi_rec2",          HIDKeyboardDescriptorParser, 1, None],
+    ["synthetic_endpoint_last", HIDMouseDescriptorParser, 1, None],
+    # no match expected
+    ["synthetic_blength0",          HIDMouseDescriptorParser, None, None],
+    ["synthetic_blength1",          HIDMouseDescriptorParser, None, None],
+    ["synthetic_past_total_length", HIDMouseDescriptorParser, None, None],
+]
+
 class DescriptorTests(unittest.TestCase):
 
-    @parameterized.expand([
-        ["arturia_keylabmkii", MIDIDescriptorParser, 1, 2],
-        ["oxi_one",            MIDIDescriptorParser, 1, 1],
-        ["yamaha_cp73",        MIDIDescriptorParser, 2, 3],
-        ["yamaha_pssa50",      MIDIDescriptorParser, 2, 1],
-        ["android_uac_midi",   MIDIDescriptorParser, 1, 1],
-        ["korg_microkey2",     MIDIDescriptorParser, 2, 1],
-        ["sandisk_32gen1",     MSCDescriptorParser, 1, 2],
-        ["samsung_ssd_t5",     MSCDescriptorParser, 1, 2],
-        ["anker_cardreader",   MSCDescriptorParser, 2, 1],
-        ["logi_g502",          HIDMouseDescriptorParser, 1, None],
-        # dual-function wireless receivers (keyboard and mouse, we selecting one function)
-        ["logi_rec1",          HIDMouseDescriptorParser, 2, None],
-        ["logi_rec2",          HIDKeyboardDescriptorParser, 1, None],
-    ])
-    def test_descriptor_parser(self, name, parser_cls, expected_endp_in, expected_endp_out):
+    # o.valid is registered a few cycles after the byte that completes it.
+    _SETTLE_CYCLES = 4
 
-        dut = DomainRenamer({"usb": "sync"})(parser_cls())
+    def _run_parser(self, name, parser_cls, expected_endp_in, expected_endp_out, *, debug):
+        """
+        Stream descriptor ``name`` into a fresh parser. If both expected
+        endpoints are None, the parser must not report a match.
+        """
+
+        dut = DomainRenamer({"usb": "sync"})(parser_cls(debug=debug))
+        expect_valid = expected_endp_in is not None or expected_endp_out is not None
 
         async def testbench(ctx):
             ctx.set(dut.enable, 1)
-            with open(f'tests/data/usbdesc_config/{name}.bin', 'rb') as f:
-                for byte in f.read():
-                    await test_util.put(ctx, dut.i, byte)
-            ctx.tick()
-            self.assertEqual(ctx.get(dut.o.valid), 1)
+            await test_util.put_many(ctx, dut.i, DESCRIPTORS[name])
+            await ctx.tick().repeat(self._SETTLE_CYCLES)
+            self.assertEqual(ctx.get(dut.o.valid), int(expect_valid))
             if expected_endp_in is not None:
                 self.assertEqual(ctx.get(dut.o.i_endp.number), expected_endp_in)
             if expected_endp_out is not None:
                 self.assertEqual(ctx.get(dut.o.o_endp.number), expected_endp_out)
 
-        sim = Simulator(dut)
-        sim.add_clock(1e-6)
-        sim.add_testbench(testbench)
-        with sim.write_vcd(vcd_file=open(f"test_endpoint_extractor_{name}.vcd", "w")):
-            sim.run()
+        test_util.run_simulation(dut, testbench,
+            vcd_filename=f"test_endpoint_extractor_{name}{'_debug' if debug else ''}.vcd")
+
+    @parameterized.expand(PARSER_CASES)
+    def test_descriptor_parser(self, name, parser_cls, expected_endp_in, expected_endp_out):
+        self._run_parser(name, parser_cls, expected_endp_in, expected_endp_out, debug=False)
+
+    @parameterized.expand(PARSER_CASES)
+    def test_descriptor_parser_debug(self, name, parser_cls, expected_endp_in, expected_endp_out):
+        """
+        As above, with the debug traces elaborated, which also captures
+        every header byte rather than just the ones read as-is.
+        """
+        self._run_parser(name, parser_cls, expected_endp_in, expected_endp_out, debug=True)
+
+    def test_endpoint_filter_required(self):
+        with self.assertRaisesRegex(TypeError, "endpoint_filter"):
+            USBDescriptorParser(
+                transfer_type=EndpointTransferType.INTERRUPT,
+                interface_class=InterfaceClass.HID,
+            )
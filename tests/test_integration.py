@@ -19,6 +19,12 @@ from guh.util import test_util
 
 class IntegrationTests(unittest.TestCase):
 
+    # MIDI consumer stall (long enough to fill the MIDI FIFO at any speed
+    # tested), and timeout for the bytes collected after it.
+    _MIDI_STALL_CYCLES = 20000
+    _MIDI_TIMEOUT_CYCLES = 100000
+    _MIDI_FIFO_DEPTH = 128
+
     @parameterized.expand([
         ["full_speed_mps8", True, 8],
         ["full_speed_mps64", True, 64],
@@ -35,7 +41,7 @@ class IntegrationTests(unittest.TestCase):
 
         test_util.patch_usb_timing_for_simulation()
 
-        host = USBMIDIHost(device_address=0x12)
+        host = USBMIDIHost(device_address=0x12, fifo_depth=self._MIDI_FIFO_DEPTH)
         m.submodules.hst = hst = DomainRenamer({"usb": "sync"})(host)
         m.submodules.dev = dev = DomainRenamer({"usb": "sync"})(
             FakeUSBMIDIDevice(full_speed_only=full_speed_only, max_packet_size=max_packet_size))
@@ -44,25 +50,50 @@ class IntegrationTests(unittest.TestCase):
 
         expected_speed = USBHostSpeed.FULL if full_speed_only else USBHostSpeed.HIGH
         midi_bytes_received = []
+        # Enough bytes to span several IN transactions after the FIFO fills.
+        n_bytes = self._MIDI_FIFO_DEPTH + 2 * max_packet_size
+        midi_xfer = Signal()
+        midi_done = Signal()
+        m.d.comb += midi_xfer.eq(hst.o_midi.valid & hst.o_midi.ready)
+
+        async def midi_sink(ctx):
+            # Sleep until a transfer starts, then take one byte per cycle
+            # for as long as the stream keeps transferring.
+            while len(midi_bytes_received) < n_bytes:
+                await ctx.posedge(midi_xfer)
+                async for _, _, xfer, data in ctx.tick().sample(midi_xfer, hst.o_midi.payload.data):
+                    if not xfer:
+                        break
+                    midi_bytes_received.append(data)
+                    if len(midi_bytes_received) == n_bytes:
+                        break
+            ctx.set(midi_done, 1)
 
         async def testbench(ctx):
-            ctx.set(hst.o_midi.ready, 1)
-            for _ in range(80000):
-                await ctx.tick()
-                if ctx.get(hst.o_midi.valid):
-                    midi_bytes_received.append(ctx.get(hst.o_midi.payload.data))
-            self.assertGreater(len(midi_bytes_received), 0,
-                "Expected MIDI output bytes but none were received")
+            # Sleep until the first MIDI byte arrives, or time out.
+            midi_valid, _ = await ctx.posedge(hst.o_midi.valid).delay(80000/60e6)
+            self.assertTrue(midi_valid, "Expected MIDI output bytes but none were received")
             self.assertTrue(ctx.get(hst.sie.ctrl.status.detected_speed == expected_speed),
                 f"Expected detected speed to be {expected_speed.name}")
 
-        sim = Simulator(m)
-        sim.add_clock(1/60e6)
-        sim.add_testbench(testbench)
-        sim.add_process(test_util.make_packet_capture_process(
-            hst.sie.utmi, dev.utmi, bus_event, f"test_usb_midi_host_integration_{name}.pcap"))
-        with sim.write_vcd(vcd_file=open(f"test_usb_midi_host_integration_{name}.vcd", "w")):
-            sim.run()
+            # Stall the consumer so the MIDI FIFO fills up and polling pauses,
+            # then drain it while more packets arrive.
+            await ctx.tick().repeat(self._MIDI_STALL_CYCLES)
+            ctx.set(hst.o_midi.ready, 1)
+            await ctx.posedge(midi_done).delay(self._MIDI_TIMEOUT_CYCLES/60e6)
+
+            # The device streams an upcounting byte, so any lost, duplicated
+            # or reordered packet breaks the sequence.
+            self.assertEqual(len(midi_bytes_received), n_bytes)
+            first = midi_bytes_received[0]
+            self.assertEqual(midi_bytes_received,
+                             [(first + i) & 0xff for i in range(n_bytes)])
+
+        test_util.run_simulation(m, testbench,
+            vcd_filename=f"test_usb_midi_host_integration_{name}.vcd",
+            clock_period=1/60e6,
+            processes=[midi_sink, test_util.make_packet_capture_process(
+                hst.sie.utmi, dev.utmi, bus_event, f"test_usb_midi_host_integration_{name}.pcap")])
 
     def test_usb_msc_host_integration(self):
         """
@@ -131,10 +162,8 @@ class IntegrationTests(unittest.TestCase):
             # Verify no unexpected errors occurred
             self.assertFalse(ctx.get(hst.resp.error), "Block read reported error")
 
-        sim = Simulator(m)
-        sim.add_clock(1/60e6)
-        sim.add_testbench(testbench)
-        sim.add_process(test_util.make_packet_capture_process(
-            hst.sie.utmi, dev.utmi, bus_event, "test_usb_msc_host_integration.pcap"))
-        with sim.write_vcd(vcd_file=open("test_usb_msc_host_integration.vcd", "w")):
-            sim.run()
+        test_util.run_simulation(m, testbench,
+            vcd_filename="test_usb_msc_host_integration.vcd",
+            clock_period=1/60e6,
+            processes=[test_util.make_packet_capture_process(
+                hst.sie.utmi, dev.utmi, bus_event, "test_usb_msc_host_integration.pcap")])
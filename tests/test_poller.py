@@ -0,0 +1,139 @@
+# Copyright (c) 2024 Seb Holzapfel <me@sebholzapfel.com>
+#
+# SPDX-License-Identifier: BSD-3-Clause
+"""
+Tests for the IN endpoint poller, against a scripted SIE.
+"""
+
+import unittest
+
+from amaranth import *
+from amaranth.sim import *
+
+from guh.usbh.poller import USBPoller
+from guh.usbh.sie import DataPID, TransferResponse
+from guh.util import test_util
+
+
+class PollerTests(unittest.TestCase):
+
+    # Cycles the scripted SIE stays busy for each poll.
+    _BUSY_CYCLES = 8
+    # Cycles to wait for a poll that should (or should not) be issued.
+    _POLL_TIMEOUT_CYCLES = 64
+
+    def _make_dut(self, **kwargs):
+        return DomainRenamer({"usb": "sync"})(
+            USBPoller(watchdog_cycles=1 << 16, **kwargs))
+
+    async def _wait_start(self, ctx, dut):
+        """
+        Wait for ``xfer.start``, returning the data PID it was issued
+        with, or None on timeout. The SIE goes busy on the same edge.
+        """
+        for _ in range(self._POLL_TIMEOUT_CYCLES):
+            _, _, start, pid = await ctx.tick().sample(
+                    dut.xfer.start, dut.xfer.data_pid)
+            if start:
+                ctx.set(dut.xfer_status.idle, 0)
+                return pid
+        return None
+
+    async def _respond(self, ctx, dut, response):
+        """
+        Finish the current poll with ``response`` after a few busy cycles.
+        """
+        await ctx.tick().repeat(self._BUSY_CYCLES)
+        ctx.set(dut.xfer_status.response, response)
+        ctx.set(dut.xfer_status.idle, 1)
+
+    def test_data_pid_toggle(self):
+        """
+        ``ack`` strobes once per ACKed poll, and the data PID only toggles on ACK.
+        """
+
+        dut = self._make_dut(sof_paced=False)
+
+        responses = [
+            (TransferResponse.ACK,   DataPID.DATA0),
+            (TransferResponse.NAK,   DataPID.DATA1),
+            (TransferResponse.ACK,   DataPID.DATA1),
+            (TransferResponse.STALL, DataPID.DATA0),
+            (TransferResponse.ACK,   DataPID.DATA0),
+        ]
+        events = []
+
+        async def process(ctx):
+            async for _, _, start, ack in ctx.tick().sample(dut.xfer.start, dut.ack):
+                if start:
+                    events.append("start")
+                if ack:
+                    events.append("ack")
+
+        async def testbench(ctx):
+            ctx.set(dut.xfer_status.idle, 1)
+            self.assertIsNone(await self._wait_start(ctx, dut),
+                "Poll issued before enumeration")
+            ctx.set(dut.enumerated, 1)
+            for response, expected_pid in responses:
+                pid = await self._wait_start(ctx, dut)
+                self.assertEqual(pid, expected_pid, f"Data PID before {response.name}")
+                await self._respond(ctx, dut, response)
+            await self._wait_start(ctx, dut)
+            self.assertEqual(events, [
+                "start", "ack",
+                "start",
+                "start", "ack",
+                "start",
+                "start", "ack",
+                "start",
+            ])
+
+        test_util.run_simulation(dut, testbench,
+            vcd_filename="test_poller_data_pid_toggle.vcd",
+            processes=[process])
+
+    def test_pause(self):
+        """
+        No poll is issued while ``pause`` is held.
+        """
+
+        dut = self._make_dut(sof_paced=False)
+
+        async def testbench(ctx):
+            ctx.set(dut.xfer_status.idle, 1)
+            ctx.set(dut.enumerated, 1)
+            ctx.set(dut.pause, 1)
+            self.assertIsNone(await self._wait_start(ctx, dut),
+                "Poll issued while paused")
+            ctx.set(dut.pause, 0)
+            self.assertIsNotNone(await self._wait_start(ctx, dut),
+                "No poll issued after pause released")
+            await self._respond(ctx, dut, TransferResponse.ACK)
+            ctx.set(dut.pause, 1)
+            self.assertIsNone(await self._wait_start(ctx, dut),
+                "Poll issued while paused")
+
+        test_util.run_simulation(dut, testbench,
+            vcd_filename="test_poller_pause.vcd")
+
+    def test_sof_paced(self):
+        """
+        With ``sof_paced``, at most one poll is issued per SOF frame.
+        """
+
+        dut = self._make_dut(sof_paced=True)
+
+        async def testbench(ctx):
+            ctx.set(dut.xfer_status.idle, 1)
+            ctx.set(dut.enumerated, 1)
+            for frame in range(1, 4):
+                ctx.set(dut.xfer_status.sof_frame, frame)
+                self.assertIsNotNone(await self._wait_start(ctx, dut),
+                    f"No poll issued in frame {frame}")
+                await self._respond(ctx, dut, TransferResponse.ACK)
+                self.assertIsNone(await self._wait_start(ctx, dut),
+                    f"Second poll issued in frame {frame}")
+
+        test_util.run_simulation(dut, testbench,
+            vcd_filename="test_poller_sof_paced.vcd")
@@ -20,6 +20,15 @@ from guh.usbh.sie import (
     USBTokenPacketGenerator,
 )
 from guh.protocol.setup import SetupPayload
+from guh.util import test_util
+
+
+def _wire_bits(bits):
+    """
+    Pack one of LUNA's reference packets, a string of bits in wire
+    (LSB-first) order, into an int with the first bit on the wire at bit 0.
+    """
+    return int(bits[::-1], 2)
 
 
 class TokenTests(unittest.TestCase):
@@ -38,14 +47,14 @@ class TokenTests(unittest.TestCase):
         return _sof
 
     @parameterized.expand([
-        ["setup00", _setup_token(TokenPID.SETUP, 0, 0),   testp.token_packet(testp.PID.SETUP, 0, 0)],
-        ["out00",   _setup_token(TokenPID.OUT, 0, 0),     testp.token_packet(testp.PID.OUT, 0, 0)],
-        ["in00",    _setup_token(TokenPID.IN, 0, 0),      testp.token_packet(testp.PID.IN, 0, 0)],
-        ["in01",    _setup_token(TokenPID.IN, 0, 1),      testp.token_packet(testp.PID.IN, 0, 1)],
-        ["in10",    _setup_token(TokenPID.IN, 1, 0),      testp.token_packet(testp.PID.IN, 1, 0)],
-        ["in7a",    _setup_token(TokenPID.IN, 0x70, 0xa), testp.token_packet(testp.PID.IN, 0x70, 0xa)],
-        ["sof_min", _setup_sof_token(1),                  testp.sof_packet(1)],
-        ["sof_max", _setup_sof_token(2**11-1),            testp.sof_packet(2**11-1)],
+        ["setup00", _setup_token(TokenPID.SETUP, 0, 0),   _wire_bits(testp.token_packet(testp.PID.SETUP, 0, 0))],
+        ["out00",   _setup_token(TokenPID.OUT, 0, 0),     _wire_bits(testp.token_packet(testp.PID.OUT, 0, 0))],
+        ["in00",    _setup_token(TokenPID.IN, 0, 0),      _wire_bits(testp.token_packet(testp.PID.IN, 0, 0))],
+        ["in01",    _setup_token(TokenPID.IN, 0, 1),      _wire_bits(testp.token_packet(testp.PID.IN, 0, 1))],
+        ["in10",    _setup_token(TokenPID.IN, 1, 0),      _wire_bits(testp.token_packet(testp.PID.IN, 1, 0))],
+        ["in7a",    _setup_token(TokenPID.IN, 0x70, 0xa), _wire_bits(testp.token_packet(testp.PID.IN, 0x70, 0xa))],
+        ["sof_min", _setup_sof_token(1),                  _wire_bits(testp.sof_packet(1))],
+        ["sof_max", _setup_sof_token(2**11-1),            _wire_bits(testp.sof_packet(2**11-1))],
     ])
     def test_usb_tokens(self, name, test_payload, test_ref):
         """
@@ -66,18 +75,13 @@ class TokenTests(unittest.TestCase):
                 data.append(int(ctx.get(dut.tx.data)))
                 await ctx.tick()
             print("[packet]", [hex(d) for d in data])
-            bs = ("{0:08b}".format(data[0])[::-1] +
-                  "{0:08b}".format(data[1])[::-1] +
-                  "{0:08b}".format(data[2])[::-1])
-            print("[ref]", test_ref)
-            print("[got]", bs)
-            self.assertEqual(bs, test_ref)
-
-        sim = Simulator(dut)
-        sim.add_clock(1e-6)
-        sim.add_testbench(testbench)
-        with sim.write_vcd(vcd_file=open(f"test_usb_token_{name}.vcd", "w")):
-            sim.run()
+            got = data[0] | (data[1] << 8) | (data[2] << 16)
+            print("[ref]", f"{test_ref:#08x}")
+            print("[got]", f"{got:#08x}")
+            self.assertEqual(got, test_ref)
+
+        test_util.run_simulation(dut, testbench,
+            vcd_filename=f"test_usb_token_{name}.vcd")
 
 
 class SetupPayloadTests(unittest.TestCase):